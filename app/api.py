@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from pydantic import BaseModel, Field
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from batching import SearchBatcher
+from components import ComponentLoader
+from telemetry import instrument_fastapi
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+
+class SearchRequest(BaseModel):
+    query: str
+    top_k: int = Field(5, ge=1, le=100)
+    # Restrict the search to these shards (e.g. one tenant); all shards when omitted
+    shards: Optional[List[str]] = None
+
+components: Dict[str, Any] = {}
+
+async def finish_loading(loader: ComponentLoader):
+    """Publish the model-dependent components once the background load completes"""
+    vector_store, embedding_model, document_ingestor, search_engine, ingestion_pipeline = \
+        await asyncio.to_thread(loader.wait)
+    batcher = SearchBatcher(
+        search_engine,
+        max_batch_size=int(os.environ.get("SEARCH_MAX_BATCH_SIZE", 32)),
+        max_wait_ms=float(os.environ.get("SEARCH_MAX_WAIT_MS", 5))
+    )
+    await batcher.start()
+    components.update(
+        embedding_model=embedding_model,
+        document_ingestor=document_ingestor,
+        search_engine=search_engine,
+        ingestion_pipeline=ingestion_pipeline,
+        batcher=batcher
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Opening the store is blocking, so keep it off the event loop; the model loads in the background
+    loader = await asyncio.to_thread(ComponentLoader().start)
+    components.update(
+        loader=loader,
+        vector_store=loader.vector_store,
+        # One ingest at a time; concurrent diffs of the same document would race
+        ingest_lock=asyncio.Lock()
+    )
+    loading = asyncio.create_task(finish_loading(loader))
+    yield
+    loading.cancel()
+    if "batcher" in components:
+        await components["batcher"].stop()
+    components.clear()
+
+def require(name: str):
+    """Return a component, or answer 503 while the model is still loading"""
+    if name not in components:
+        raise HTTPException(status_code=503, detail="Embedding model is still loading")
+    return components[name]
+
+app = FastAPI(title="Vector QA API", lifespan=lifespan)
+instrument_fastapi(app)
+
+@app.post("/search")
+async def search(request: SearchRequest):
+    """Search document chunks; concurrent requests are micro-batched"""
+    results = await require("batcher").search(request.query, request.top_k, request.shards)
+    return {"query": request.query, "results": results}
+
+@app.post("/ingest")
+async def ingest(file: UploadFile = File(...), tenant: Optional[str] = Form(None)):
+    """Upload and ingest a PDF or text document, optionally on behalf of a tenant"""
+    filename = os.path.basename(file.filename or "")
+    if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+    # "<tenant>/<file>" keeps chunk IDs apart and routes the document to the tenant's shard
+    document_name = f"{tenant}/{filename}" if tenant else filename
+    
+    vector_store = components["vector_store"]
+    document_ingestor = require("document_ingestor")
+    ingestion_pipeline = require("ingestion_pipeline")
+    async with components["ingest_lock"]:
+        filepath, file_hash = await asyncio.to_thread(
+            document_ingestor.save_stream_with_hash, filename, file.file
+        )
+        if await asyncio.to_thread(vector_store.is_file_ingested, file_hash):
+            existing_names = await asyncio.to_thread(vector_store.get_filenames_for_hash, file_hash)
+            # Content stored for another tenant is not searchable from this tenant's shard
+            if not tenant or any(name.startswith(f"{tenant}/") for name in existing_names):
+                return {"filename": document_name, "status": "duplicate", "existing_filenames": existing_names}
+        
+        try:
+            summary = await asyncio.to_thread(
+                ingestion_pipeline.ingest_file, filepath, file_hash, None, document_name
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    
+    return {"filename": document_name, "status": "ingested", **summary}
+
+@app.get("/health")
+async def health():
+    """Readiness and startup timings"""
+    status = components["loader"].get_status()
+    status["ready"] = status["ready"] and "batcher" in components
+    return status
+
+@app.get("/stats")
+async def stats():
+    """Collection, cache and batching statistics"""
+    embedding_model = components.get("embedding_model")
+    search_engine = components.get("search_engine")
+    return {
+        "total_chunks": await asyncio.to_thread(components["vector_store"].get_collection_count),
+        "shards": components["vector_store"].shard_names(),
+        "dedup": components["vector_store"].dedup_index.get_stats() if components["vector_store"].dedup_index else None,
+        "embedding_cache": embedding_model.cache.get_stats() if embedding_model and embedding_model.cache else None,
+        "result_cache": search_engine.result_cache.get_stats() if search_engine else None,
+        "search_batching": components["batcher"].get_stats() if "batcher" in components else None
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    
+    uvicorn.run(
+        app,
+        host=os.environ.get("API_HOST", "0.0.0.0"),
+        port=int(os.environ.get("API_PORT", 8000))
+    )
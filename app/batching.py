@@ -0,0 +1,92 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+class SearchBatcher:
+    def __init__(self, search_engine, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.search_engine = search_engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.queries = 0
+    
+    async def start(self):
+        """Start collecting requests on the running event loop"""
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the batching loop"""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+    
+    async def search(self, query: str, top_k: int = 10,
+                     shards: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Queue a query and wait for the batch it ends up in"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, top_k, tuple(sorted(shards)) if shards else None, future))
+        return await future
+    
+    async def _collect(self) -> List[tuple]:
+        """Wait for one request, then gather more for up to max_wait"""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Requests may have been cancelled while they waited
+            batch = [item for item in batch if not item[3].done()]
+            if not batch:
+                continue
+            
+            # Requests for different shards can't share a vector store query
+            groups: Dict[Optional[tuple], List[tuple]] = {}
+            for item in batch:
+                groups.setdefault(item[2], []).append(item)
+            for shards, group in groups.items():
+                await self._search_group(group, list(shards) if shards else None)
+            self.batches += 1
+            self.queries += len(batch)
+    
+    async def _search_group(self, group: List[tuple], shards: Optional[List[str]]):
+        queries = [query for query, _, _, _ in group]
+        max_top_k = max(top_k for _, top_k, _, _ in group)
+        try:
+            # One batched encode and vector store query, off the event loop
+            results = await asyncio.to_thread(self.search_engine.search_many, queries, max_top_k, shards)
+        except Exception as e:
+            for _, _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, top_k, _, future), query_results in zip(group, results):
+            if not future.done():
+                # Results are sorted by similarity, so trimming matches a top_k query
+                future.set_result(query_results[:top_k])
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Return batching counters"""
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "average_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "queued": self.queue.qsize() if self.queue is not None else 0
+        }
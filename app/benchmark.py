@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from ingest import DocumentIngestor
+from result_cache import ResultCache
+from search import SearchEngine
+from vector_store import VectorStore
+
+ENGLISH_WORDS = (
+    "the report river market school health budget water village teacher student farmer price "
+    "season harvest rice fish road bridge hospital doctor patient policy office district union "
+    "council election survey data model network energy solar power climate flood cyclone coast "
+    "delta boat train station factory garment worker wage export import bank loan credit savings "
+    "mobile phone internet service customer account payment language culture festival music "
+    "history science research university library book paper chapter section summary result"
+).split()
+BANGLA_WORDS = (
+    "নদী বাজার বিদ্যালয় স্বাস্থ্য বাজেট পানি গ্রাম শিক্ষক ছাত্র কৃষক দাম মৌসুম ফসল ধান মাছ রাস্তা "
+    "সেতু হাসপাতাল ডাক্তার রোগী নীতি অফিস জেলা ইউনিয়ন পরিষদ নির্বাচন জরিপ তথ্য মডেল শক্তি "
+    "সৌর বিদ্যুৎ জলবায়ু বন্যা ঘূর্ণিঝড় উপকূল নৌকা ট্রেন স্টেশন কারখানা পোশাক শ্রমিক মজুরি রপ্তানি "
+    "আমদানি ব্যাংক ঋণ সঞ্চয় মোবাইল সেবা গ্রাহক হিসাব ভাষা সংস্কৃতি উৎসব গান ইতিহাস বিজ্ঞান "
+    "গবেষণা বিশ্ববিদ্যালয় গ্রন্থাগার বই অধ্যায় সারাংশ ফলাফল এবং কিন্তু জন্য থেকে মধ্যে"
+).split()
+
+def synthetic_text(rng: np.random.Generator, n_words: int, bangla_share: float = 0.5) -> str:
+    """Mixed Bangla/English prose; each document leans on its own topic words so chunks differ"""
+    vocabulary = np.array(ENGLISH_WORDS + BANGLA_WORDS)
+    is_bangla = np.array([False] * len(ENGLISH_WORDS) + [True] * len(BANGLA_WORDS))
+    weights = np.where(is_bangla, bangla_share, 1 - bangla_share) * rng.gamma(0.3, size=len(vocabulary))
+    words = rng.choice(vocabulary, size=n_words, p=weights / weights.sum())
+    
+    sentences = []
+    start = 0
+    while start < n_words:
+        length = int(rng.integers(6, 18))
+        sentence = " ".join(words[start:start + length])
+        end_mark = "।" if words[start] in BANGLA_WORDS else "."
+        sentences.append(sentence + end_mark)
+        start += length
+    # Paragraph breaks every few sentences, like extracted documents
+    return "\n".join(" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5))
+
+def wrap_lines(text: str, line_chars: int = 80) -> List[str]:
+    """Greedy word wrap of each paragraph"""
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > line_chars:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        if line:
+            lines.append(line)
+    return lines
+
+def write_pdf(path: str, text: str, lines_per_page: int = 45):
+    """Write a minimal text PDF whose ToUnicode map makes Bangla extractable without an embedded font"""
+    lines = wrap_lines(text)
+    # A simple font addresses at most 256 codes, so characters beyond those are dropped
+    free_codes = iter(range(33, 256))
+    codes = {" ": 32}
+    for char in sorted(set(text) - {"\n", " "}):
+        code = next(free_codes, None)
+        if code is None:
+            break
+        codes[char] = code
+    
+    def encode_line(line: str) -> str:
+        return "".join(f"{codes[char]:02X}" for char in line if char in codes)
+    
+    to_unicode = ["/CIDInit /ProcSet findresource begin", "12 dict begin", "begincmap",
+                  "/CMapName /Bench-UCS def", "/CMapType 2 def",
+                  "1 begincodespacerange <00> <FF> endcodespacerange"]
+    entries = [f"<{code:02X}> <{''.join(f'{unit:04X}' for unit in np.frombuffer(char.encode('utf-16-be'), '>u2'))}>"
+               for char, code in codes.items()]
+    for start in range(0, len(entries), 100):
+        batch = entries[start:start + 100]
+        to_unicode += [f"{len(batch)} beginbfchar"] + batch + ["endbfchar"]
+    to_unicode += ["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"]
+    
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{6 + 2 * i} 0 R' for i in range(len(pages)))}] "
+        f"/Count {len(pages)} >>".encode(),
+        # Non-standard base font name, so readers use these widths instead of built-in metrics
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /BenchSans /FirstChar 0 /LastChar 255 "
+        b"/Widths [" + b" ".join([b"500"] * 256) + b"] /FontDescriptor 5 0 R /ToUnicode 4 0 R >>",
+        None,
+        b"<< /Type /FontDescriptor /FontName /BenchSans /Flags 32 /FontBBox [0 -200 1000 800] "
+        b"/ItalicAngle 0 /Ascent 800 /Descent -200 /CapHeight 700 /StemV 80 >>"
+    ]
+    cmap = "\n".join(to_unicode).encode()
+    objects[3] = b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"\nendstream"
+    for i, page_lines in enumerate(pages):
+        content = "BT /F1 10 Tf 14 TL 40 800 Td\n" + "\n".join(
+            f"<{encode_line(line)}> Tj T*" for line in page_lines
+        ) + "\nET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {7 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content.encode() + b"\nendstream")
+    
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+def generate_corpus(directory: str, n_documents: int, words_per_document: int = 3000,
+                    pdf_share: float = 0.25, seed: int = 0) -> Dict[str, List[str]]:
+    """Write a reproducible mix of TXT and PDF documents; return their paths by format"""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths: Dict[str, List[str]] = {"txt": [], "pdf": []}
+    for index in range(n_documents):
+        text = synthetic_text(rng, words_per_document)
+        if rng.random() < pdf_share:
+            path = os.path.join(directory, f"doc-{index:05d}.pdf")
+            write_pdf(path, text)
+            paths["pdf"].append(path)
+        else:
+            path = os.path.join(directory, f"doc-{index:05d}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            paths["txt"].append(path)
+    return paths
+
+class HashingEmbeddingModel:
+    """Deterministic offline stand-in for EmbeddingModel: signed feature hashing of words and word pairs"""
+    
+    def __init__(self, dim: int = 384):
+        self.model_name = f"hashing-{dim}"
+        self.dim = dim
+        self.cache = None
+    
+    def _embed(self, text: str) -> List[float]:
+        words = text.casefold().split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            hashed = zlib.crc32(feature.encode("utf-8"))
+            vector[hashed % self.dim] += 1.0 if hashed & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+    
+    def get_model_tokenizer(self):
+        # No model tokenizer, so documents are chunked by words
+        return None
+    
+    def get_max_seq_length(self) -> int:
+        return 256
+    
+    def embed_texts(self, texts: List[str], skip_truncation: bool = False) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+    
+    def embed_query(self, query: str) -> List[float]:
+        return self._embed(query)
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_texts(queries)
+    
+    def close(self):
+        pass
+
+def timed(function, *args, **kwargs) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def rate(count: int, seconds: float) -> float:
+    return count / seconds if seconds > 0 else 0.0
+
+def bench_pdf_extraction(ingestor: DocumentIngestor, paths: List[str]) -> Dict[str, Any]:
+    """Pages per second of extract_text_from_pdf"""
+    if not paths:
+        return {"documents": 0}
+    pages = sum(ingestor.get_pdf_page_count(path) for path in paths)
+    _, seconds = timed(lambda: [ingestor.extract_text_from_pdf(path) for path in paths])
+    return {"documents": len(paths), "pages": pages, "seconds": seconds, "pages_per_s": rate(pages, seconds)}
+
+def bench_chunking(ingestor: DocumentIngestor, paths: List[str]) -> Tuple[Dict[str, Any], List[str], List[Dict[str, Any]]]:
+    """Chunks per second of process_document (extraction, cleaning and chunking)"""
+    chunks: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    start = time.perf_counter()
+    for path in paths:
+        document_chunks, document_metadatas, _ = ingestor.process_document(path)
+        chunks.extend(document_chunks)
+        metadatas.extend(document_metadatas)
+    seconds = time.perf_counter() - start
+    return {"documents": len(paths), "chunks": len(chunks), "seconds": seconds,
+            "chunks_per_s": rate(len(chunks), seconds)}, chunks, metadatas
+
+def bench_embedding(embedding_model, chunks: List[str], skip_truncation: bool) -> Tuple[Dict[str, Any], List[List[float]]]:
+    """Chunks per second of embed_texts"""
+    embeddings, seconds = timed(embedding_model.embed_texts, chunks, skip_truncation=skip_truncation)
+    return {"chunks": len(chunks), "seconds": seconds, "chunks_per_s": rate(len(chunks), seconds)}, embeddings
+
+def bench_insert(vector_store: VectorStore, chunks: List[str], embeddings: List[List[float]],
+                 metadatas: List[Dict[str, Any]], ids: List[str], batch_size: int = 64) -> Dict[str, Any]:
+    """Chunks per second of add_chunks in ingest-sized batches"""
+    start = time.perf_counter()
+    for offset in range(0, len(chunks), batch_size):
+        end = offset + batch_size
+        vector_store.add_chunks(chunks[offset:end], embeddings[offset:end], metadatas[offset:end], ids[offset:end])
+    seconds = time.perf_counter() - start
+    return {"chunks": len(chunks), "batch_size": batch_size, "seconds": seconds,
+            "chunks_per_s": rate(len(chunks), seconds)}
+
+def bench_search(search_engine: SearchEngine, embedding_model, chunks: List[str], embeddings: List[List[float]],
+                 ids: List[str], n_queries: int = 100, k: int = 10, seed: int = 0) -> Dict[str, Any]:
+    """search_documents latency, and recall@k against brute-force cosine search over every chunk"""
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    
+    queries = []
+    for chunk_index in rng.choice(len(chunks), size=n_queries):
+        # A window of a stored chunk, like a user quoting a passage
+        words = chunks[chunk_index].split()
+        start = int(rng.integers(0, max(1, len(words) - 12)))
+        queries.append(" ".join(words[start:start + 12]))
+    
+    latencies = []
+    recalls = []
+    for query in queries:
+        started = time.perf_counter()
+        results = search_engine.search_documents(query, top_k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = [result["chunk_id"] for result in results if "chunk_id" in result]
+        
+        query_vector = np.asarray(embedding_model.embed_query(query), dtype=np.float32)
+        scores = matrix @ (query_vector / max(np.linalg.norm(query_vector), 1e-12))
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        exact = {ids[i] for i in top}
+        recalls.append(len(set(found) & exact) / len(exact))
+    return {
+        "queries": n_queries,
+        "k": k,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "recall_at_k": float(np.mean(recalls))
+    }
+
+def run_benchmark(work_dir: str, n_documents: int, embedding_model, backend: str = "chroma",
+                  words_per_document: int = 3000, pdf_share: float = 0.25, n_queries: int = 100,
+                  k: int = 10, seed: int = 0) -> Dict[str, Any]:
+    """Run every stage once over a fresh corpus of n_documents and a fresh vector store"""
+    paths = generate_corpus(os.path.join(work_dir, "corpus"), n_documents, words_per_document, pdf_share, seed)
+    ingestor = DocumentIngestor(
+        upload_dir=os.path.join(work_dir, "uploads"),
+        tokenizer=embedding_model.get_model_tokenizer(),
+        max_tokens=embedding_model.get_max_seq_length()
+    )
+    skip_truncation = ingestor.chunking_mode == "tokens"
+    
+    result: Dict[str, Any] = {"documents": n_documents, "txt_documents": len(paths["txt"]),
+                              "pdf_documents": len(paths["pdf"]), "chunking_mode": ingestor.chunking_mode}
+    try:
+        result["pdf_extraction"] = bench_pdf_extraction(ingestor, paths["pdf"])
+        result["process_document"], chunks, metadatas = bench_chunking(ingestor, paths["txt"] + paths["pdf"])
+    except ImportError as e:
+        # PDFs need pdfplumber; the TXT part of the corpus still runs
+        result["pdf_extraction"] = {"skipped": str(e)}
+        result["process_document"], chunks, metadatas = bench_chunking(ingestor, paths["txt"])
+    if not chunks:
+        raise ValueError("The corpus produced no chunks; increase --words-per-document")
+    ids = [f"{metadata['filename']}_{metadata['chunk_id']}" for metadata in metadatas]
+    result["embed_texts"], embeddings = bench_embedding(embedding_model, chunks, skip_truncation)
+    
+    vector_store = VectorStore(os.path.join(work_dir, "vectors"), backend=backend)
+    result["add_chunks"] = bench_insert(vector_store, chunks, embeddings, metadatas, ids)
+    # No result cache and no similarity cut-off, so every query reaches the index and recall is comparable
+    search_engine = SearchEngine(vector_store, embedding_model, ResultCache(max_entries=0))
+    search_engine.similarity_threshold = 0.0
+    result["search_documents"] = bench_search(search_engine, embedding_model, chunks, embeddings, ids,
+                                              n_queries, k, seed)
+    return result
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark of extraction, chunking, embedding, insert and search on synthetic corpora"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200],
+                        help="Corpus sizes to run, in documents")
+    parser.add_argument("--words-per-document", type=int, default=3000, help="Words per synthetic document")
+    parser.add_argument("--pdf-share", type=float, default=0.25, help="Fraction of documents written as PDF")
+    parser.add_argument("--model", choices=["hashing", "real"], default="hashing",
+                        help="Deterministic offline stand-in, or the real EmbeddingModel")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma", help="Vector store backend")
+    parser.add_argument("--queries", type=int, default=100, help="Search queries per corpus size")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and query seed")
+    parser.add_argument("--work-dir", default=None, help="Parent directory of the temporary corpora and stores")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    
+    if args.model == "real":
+        from embed import EmbeddingModel
+        # Without the embedding cache every run encodes the same amount of work
+        embedding_model = EmbeddingModel(use_cache=False)
+    else:
+        embedding_model = HashingEmbeddingModel()
+    
+    report: Dict[str, Any] = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("work_dir", "output")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "model": embedding_model.model_name},
+        "results": []
+    }
+    try:
+        for n_documents in args.sizes:
+            with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+                report["results"].append(run_benchmark(
+                    work_dir, n_documents, embedding_model, args.backend, args.words_per_document,
+                    args.pdf_share, args.queries, args.k, args.seed
+                ))
+    finally:
+        embedding_model.close()
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
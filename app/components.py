@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+def create_vector_store(persist_directory: str = "data/vectors", dedup_threshold: Optional[float] = None,
+                        dedup_dir: Optional[str] = None, text_store=None):
+    """Open the vector store backend selected by the environment; given dedup settings override it"""
+    from vector_store import VectorStore
+    
+    backend = os.environ.get("VECTOR_BACKEND", "chroma")
+    backend_options = {}
+    if backend == "numpy" and os.environ.get("VECTOR_QUANTIZATION"):
+        backend_options["quantization"] = os.environ["VECTOR_QUANTIZATION"]
+        backend_options["rerank_factor"] = int(os.environ.get("VECTOR_RERANK_FACTOR", 4))
+    if backend == "chroma":
+        # Only applied to new collections; existing ones are rebuilt with app.hnsw_tuning --apply
+        hnsw = {
+            key: int(os.environ[variable])
+            for key, variable in (("construction_ef", "HNSW_CONSTRUCTION_EF"),
+                                  ("search_ef", "HNSW_SEARCH_EF"),
+                                  ("M", "HNSW_M"))
+            if os.environ.get(variable)
+        }
+        if hnsw:
+            backend_options["hnsw"] = hnsw
+    if os.environ.get("VECTOR_SHARD_BY"):
+        backend_options["shard_by"] = os.environ["VECTOR_SHARD_BY"]
+        backend_options["num_shards"] = int(os.environ.get("VECTOR_NUM_SHARDS", 4))
+    if dedup_threshold is None and os.environ.get("DEDUP_THRESHOLD"):
+        dedup_threshold = float(os.environ["DEDUP_THRESHOLD"])
+    if dedup_threshold is not None:
+        from dedup import NearDuplicateIndex
+        # Chunks at least this Jaccard-similar to a stored chunk reuse its embedding
+        backend_options["dedup_index"] = NearDuplicateIndex(
+            dedup_dir or os.environ.get("DEDUP_DIR", "data/dedup"),
+            threshold=dedup_threshold
+        )
+    return VectorStore(persist_directory, backend=backend, text_store=text_store, **backend_options)
+
+def create_text_store(storage: Optional[str] = None, store_dir: Optional[str] = None):
+    """Open the text store selected by the environment (or the given overrides), or None for inline text"""
+    if (storage or os.environ.get("TEXT_STORAGE", "inline")) != "blob":
+        return None
+    from text_store import DocumentTextStore
+    return DocumentTextStore(store_dir or os.environ.get("TEXT_STORE_DIR", "data/text_store"))
+
+class ComponentLoader:
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[Exception] = None
+        self.ready = threading.Event()
+        self.store_opened = threading.Event()
+        self.vector_store = None
+        self.text_store = None
+        self.components: Optional[Tuple] = None
+    
+    def start(self) -> "ComponentLoader":
+        """Load the model on a background thread while the vector store opens on this one"""
+        from telemetry import setup_telemetry
+        setup_telemetry()
+        threading.Thread(target=self._load_model, name="model-loader", daemon=True).start()
+        
+        started = time.perf_counter()
+        try:
+            self.text_store = create_text_store()
+            # The vector store deletes a document's text once none of its chunks are left
+            self.vector_store = create_vector_store(text_store=self.text_store)
+        finally:
+            self.store_opened.set()
+        self.timings["vector_store_s"] = time.perf_counter() - started
+        return self
+    
+    def _load_model(self):
+        try:
+            from embed import EmbeddingModel
+            from ingest import DocumentIngestor
+            from pipeline import IngestionPipeline
+            from result_cache import ResultCache
+            from search import SearchEngine
+            
+            started = time.perf_counter()
+            embedding_model = EmbeddingModel()
+            self.timings["model_load_s"] = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            embedding_model.warm_up()
+            self.timings["warm_up_s"] = time.perf_counter() - started
+            
+            document_ingestor = DocumentIngestor(
+                tokenizer=embedding_model.get_model_tokenizer(),
+                max_tokens=embedding_model.get_max_seq_length(),
+                extraction_workers=int(os.environ.get("PDF_EXTRACTION_WORKERS", os.cpu_count() or 1))
+            )
+            
+            # The vector store is opened concurrently on the starting thread
+            self.store_opened.wait()
+            if self.vector_store is None:
+                raise RuntimeError("Vector store could not be opened")
+            result_cache = ResultCache(
+                max_entries=int(os.environ.get("RESULT_CACHE_SIZE", 512)),
+                ttl_seconds=float(os.environ.get("RESULT_CACHE_TTL", 300))
+            )
+            search_engine = SearchEngine(self.vector_store, embedding_model, result_cache, self.text_store)
+            ingestion_pipeline = IngestionPipeline(document_ingestor, embedding_model, self.vector_store,
+                                                   text_store=self.text_store)
+            self.components = (self.vector_store, embedding_model, document_ingestor,
+                               search_engine, ingestion_pipeline)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.timings["total_s"] = time.perf_counter() - self.start_time
+            # One JSON line per start so cold-start regressions can be tracked from container logs
+            print(json.dumps({"event": "startup", "ready": self.error is None,
+                              **{key: round(value, 3) for key, value in self.timings.items()}}))
+            self.ready.set()
+    
+    def is_ready(self) -> bool:
+        """True once the model is loaded and warmed up"""
+        return self.ready.is_set() and self.error is None
+    
+    def wait(self, timeout: Optional[float] = None) -> Tuple:
+        """Block until every component is loaded and return them"""
+        if not self.ready.wait(timeout):
+            raise TimeoutError("Components are still loading")
+        if self.error is not None:
+            raise self.error
+        return self.components
+    
+    def get_status(self) -> Dict[str, object]:
+        """Readiness and startup timings for the UI and API"""
+        return {
+            "ready": self.is_ready(),
+            "loading": not self.ready.is_set(),
+            "error": str(self.error) if self.error else None,
+            "timings": dict(self.timings)
+        }
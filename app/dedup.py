@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Universal hashing modulo a Mersenne prime; a * x stays below 2**62, so uint64 never overflows
+MERSENNE_PRIME = (1 << 31) - 1
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Pick (bands, rows) so pairs near the threshold become candidates; similarity is checked after"""
+    best = (1, num_perm)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        # Jaccard similarity at which a pair has a ~50% chance of sharing a bucket; keep it
+        # well below the threshold so pairs just above it are rarely missed
+        midpoint = (1 / bands) ** (1 / rows)
+        if midpoint <= threshold * 0.9:
+            best = (bands, rows)
+    return best
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of stored chunk texts, plus links from duplicate chunks to the stored one"""
+    
+    def __init__(self, index_dir: str = "data/dedup", threshold: float = 0.9,
+                 num_perm: int = 128, shingle_words: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.lock = threading.Lock()
+        
+        os.makedirs(index_dir, exist_ok=True)
+        # Written from ingest threads and read from Streamlit script threads
+        self.conn = sqlite3.connect(os.path.join(index_dir, "dedup.sqlite"), check_same_thread=False)
+        # shard is "" in an unsharded store; duplicates are only matched within their own shard
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures (chunk_id TEXT PRIMARY KEY, signature BLOB NOT NULL, "
+            "shard TEXT NOT NULL DEFAULT '')"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, bucket INTEGER NOT NULL, chunk_id TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets ON buckets (band, bucket)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_chunk ON buckets (chunk_id)")
+        # A link keeps the duplicate's own text and signature, so it can replace a deleted canonical
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS links (chunk_id TEXT PRIMARY KEY, canonical_id TEXT NOT NULL, "
+            "filename TEXT NOT NULL, file_hash TEXT, chunk_number INTEGER, metadata TEXT NOT NULL, "
+            "shard TEXT NOT NULL DEFAULT '', document TEXT NOT NULL DEFAULT '', signature BLOB)"
+        )
+        for column in ("canonical_id", "filename", "file_hash", "shard"):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_links_{column} ON links ({column})")
+        self.conn.commit()
+    
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature over word shingles of the case-folded text"""
+        words = text.casefold().split()
+        size = min(self.shingle_words, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        values = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) & MERSENNE_PRIME for shingle in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+        hashed = (self.a[:, None] * values[None, :] + self.b[:, None]) % MERSENNE_PRIME
+        return hashed.min(axis=1).astype(np.uint32)
+    
+    def _bucket_keys(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        keys = []
+        for band in range(self.bands):
+            band_bytes = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            bucket = int.from_bytes(hashlib.blake2b(band_bytes, digest_size=8).digest(), "little", signed=True)
+            keys.append((band, bucket))
+        return keys
+    
+    def find_duplicates(self, texts: List[str], shard: str = "",
+                        exclude: Optional[Set[str]] = None) -> List[Optional[str]]:
+        """For each text, the ID of a stored chunk in the same shard at least threshold-similar, or None"""
+        exclude = exclude or set()
+        found: List[Optional[str]] = []
+        with self.lock:
+            for text in texts:
+                signature = self.signature(text)
+                candidates = set()
+                for band, bucket in self._bucket_keys(signature):
+                    candidates.update(row[0] for row in self.conn.execute(
+                        "SELECT chunk_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+                    ))
+                best_id, best_similarity = None, self.threshold
+                for chunk_id in candidates - exclude:
+                    row = self.conn.execute(
+                        "SELECT signature FROM signatures WHERE chunk_id = ? AND shard = ?", (chunk_id, shard)
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    # Fraction of matching MinHash values estimates the Jaccard similarity
+                    similarity = float(np.mean(np.frombuffer(row[0], dtype=np.uint32) == signature))
+                    if similarity >= best_similarity:
+                        best_id, best_similarity = chunk_id, similarity
+                found.append(best_id)
+        return found
+    
+    def _index(self, chunk_id: str, signature: np.ndarray, shard: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO signatures (chunk_id, signature, shard) VALUES (?, ?, ?)",
+            (chunk_id, signature.tobytes(), shard)
+        )
+        self.conn.execute("DELETE FROM buckets WHERE chunk_id = ?", (chunk_id,))
+        self.conn.executemany(
+            "INSERT INTO buckets (band, bucket, chunk_id) VALUES (?, ?, ?)",
+            [(band, bucket, chunk_id) for band, bucket in self._bucket_keys(signature)]
+        )
+    
+    def add(self, ids: List[str], texts: List[str], shard: str = ""):
+        """Index stored chunks so later near-duplicates in the same shard can link to them"""
+        with self.lock:
+            for chunk_id, text in zip(ids, texts):
+                self._index(chunk_id, self.signature(text), shard)
+            self.conn.commit()
+    
+    def link(self, ids: List[str], canonical_ids: List[str], metadatas: List[Dict[str, Any]],
+             documents: List[str], texts: List[str], shard: str = ""):
+        """Record chunks that reuse the embedding of a stored chunk, with the document each would store"""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO links (chunk_id, canonical_id, filename, file_hash, chunk_number, "
+                "metadata, shard, document, signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (chunk_id, canonical_id, metadata.get("filename", ""), metadata.get("file_hash"),
+                     metadata.get("chunk_id"), json.dumps(metadata, ensure_ascii=False), shard, document,
+                     self.signature(text).tobytes())
+                    for chunk_id, canonical_id, metadata, document, text
+                    in zip(ids, canonical_ids, metadatas, documents, texts)
+                ]
+            )
+            self.conn.commit()
+    
+    def _select_links(self, where: str, params) -> List[Tuple[str, str, Dict[str, Any]]]:
+        rows = self.conn.execute(f"SELECT chunk_id, canonical_id, metadata FROM links WHERE {where}", params)
+        return [(chunk_id, canonical_id, json.loads(metadata)) for chunk_id, canonical_id, metadata in rows]
+    
+    def _in_batches(self, column: str, values: List[str]) -> List[Tuple[str, str, Dict[str, Any]]]:
+        links = []
+        # SQLite limits the number of bound variables per statement
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            links.extend(self._select_links(f"{column} IN ({','.join('?' * len(batch))})", batch))
+        return links
+    
+    def get_links(self, ids: List[str]) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """(chunk_id, canonical_id, metadata) of the given chunks that are linked duplicates"""
+        with self.lock:
+            return self._in_batches("chunk_id", ids)
+    
+    def get_links_to(self, canonical_ids: List[str]) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """Linked duplicates of the given stored chunks"""
+        with self.lock:
+            return self._in_batches("canonical_id", canonical_ids)
+    
+    def get_documents(self, ids: List[str]) -> Dict[str, str]:
+        """The document text each linked duplicate would have stored"""
+        documents = {}
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                documents.update(self.conn.execute(
+                    f"SELECT chunk_id, document FROM links WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                ))
+        return documents
+    
+    def get_links_for(self, filename: Optional[str] = None, file_hash: Optional[str] = None,
+                      chunk_number: Optional[int] = None) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """Linked duplicates of a document, by filename and/or content hash"""
+        clauses, params = [], []
+        for column, value in (("filename", filename), ("file_hash", file_hash), ("chunk_number", chunk_number)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        with self.lock:
+            return self._select_links(" AND ".join(clauses) or "1", params)
+    
+    def count_links(self) -> Dict[str, int]:
+        """Number of linked duplicates per filename"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT filename, COUNT(*) FROM links GROUP BY filename"))
+    
+    def get_links_page(self, limit: int, offset: int = 0,
+                       filename: Optional[str] = None) -> List[Tuple[str, str, Dict[str, Any], str]]:
+        """(chunk_id, canonical_id, metadata, document) of one page of linked duplicates, in link order"""
+        where, params = ("filename = ?", [filename]) if filename is not None else ("1", [])
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT chunk_id, canonical_id, metadata, document FROM links WHERE {where} "
+                "ORDER BY rowid LIMIT ? OFFSET ?", params + [limit, offset]
+            )
+            return [(chunk_id, canonical_id, json.loads(metadata), document)
+                    for chunk_id, canonical_id, metadata, document in rows]
+    
+    def update_links(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Refresh the metadata of linked duplicates"""
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE links SET filename = ?, file_hash = ?, chunk_number = ?, metadata = ? WHERE chunk_id = ?",
+                [
+                    (metadata.get("filename", ""), metadata.get("file_hash"), metadata.get("chunk_id"),
+                     json.dumps(metadata, ensure_ascii=False), chunk_id)
+                    for chunk_id, metadata in zip(ids, metadatas)
+                ]
+            )
+            self.conn.commit()
+    
+    def unlink(self, ids: List[str]):
+        """Forget linked duplicates"""
+        with self.lock:
+            self.conn.executemany("DELETE FROM links WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            self.conn.commit()
+    
+    def promote(self, canonical_id: str, new_canonical_id: str):
+        """Make a linked duplicate the stored chunk its siblings point to, indexed by its own signature"""
+        with self.lock:
+            row = self.conn.execute("SELECT signature, shard FROM links WHERE chunk_id = ?",
+                                    (new_canonical_id,)).fetchone()
+            self.conn.execute("DELETE FROM links WHERE chunk_id = ?", (new_canonical_id,))
+            self.conn.execute("UPDATE links SET canonical_id = ? WHERE canonical_id = ?",
+                              (new_canonical_id, canonical_id))
+            self.conn.execute("DELETE FROM signatures WHERE chunk_id = ?", (canonical_id,))
+            self.conn.execute("DELETE FROM buckets WHERE chunk_id = ?", (canonical_id,))
+            if row is not None and row[0] is not None:
+                self._index(new_canonical_id, np.frombuffer(row[0], dtype=np.uint32), row[1])
+            self.conn.commit()
+    
+    def remove(self, ids: List[str]):
+        """Drop stored chunks from the index"""
+        with self.lock:
+            self.conn.executemany("DELETE FROM signatures WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            self.conn.executemany("DELETE FROM buckets WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            self.conn.commit()
+    
+    def clear_shard(self, shard: str):
+        """Forget every signature and link of one shard; links never cross shards"""
+        with self.lock:
+            self.conn.execute("DELETE FROM buckets WHERE chunk_id IN (SELECT chunk_id FROM signatures WHERE shard = ?)",
+                              (shard,))
+            self.conn.execute("DELETE FROM signatures WHERE shard = ?", (shard,))
+            self.conn.execute("DELETE FROM links WHERE shard = ?", (shard,))
+            self.conn.commit()
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Indexed and linked chunk counts"""
+        with self.lock:
+            return {
+                "indexed_chunks": self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0],
+                "linked_duplicates": self.conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+            }
+    
+    def clear(self):
+        """Remove every signature and link"""
+        with self.lock:
+            for table in ("signatures", "buckets", "links"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.commit()
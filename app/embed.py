@@ -1,11 +1,28 @@
-from sentence_transformers import SentenceTransformer
-import tiktoken
-from typing import List
-import torch
+import copy
+import os
+import time
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from telemetry import stage
+
+# Batch sizes tried when auto-tuning, and how many texts the tuning run encodes per candidate
+BATCH_SIZE_CANDIDATES = (8, 16, 32, 64, 128)
+TUNING_SAMPLE_SIZE = 256
 
 class EmbeddingModel:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2",
+                 cache: Optional[EmbeddingCache] = None, use_cache: bool = True,
+                 batch_size: Union[int, str] = 32, num_processes: int = 1):
+        # Heavy imports are deferred until a model is actually created
+        import tiktoken
+        import torch
+        from sentence_transformers import SentenceTransformer
+        
         torch.set_default_device('cpu')
+        self.model_name = model_name
         try:
             # Try offline first
             self.model = SentenceTransformer(model_name, device='cpu', local_files_only=True)
@@ -13,8 +30,40 @@ class EmbeddingModel:
             # Fallback to online download
             self.model = SentenceTransformer(model_name, device='cpu')
         self.model.eval()
+        # Lengths are counted with a private copy: calling the model's fast tokenizer resets the
+        # truncation and padding encode() relies on, and races with encode() on other threads
+        self.length_tokenizer = copy.deepcopy(self.model.tokenizer)
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
         self.max_tokens = 256
+        # Content-addressed cache of previously computed embeddings
+        if cache is None and use_cache:
+            cache = EmbeddingCache()
+        self.cache = cache
+        # Bulk encoding: batch size (or "auto" to measure on first use) and CPU worker processes
+        self.batch_size = batch_size
+        self.num_processes = max(1, num_processes)
+        self.pool = None
+    
+    def warm_up(self):
+        """Run one small encode so the first real request doesn't pay for lazy initialization"""
+        self.model.encode(["warm up"], convert_to_tensor=False)
+    
+    def cache_namespace(self, skip_truncation: bool = False) -> str:
+        """Identify the model and truncation settings an embedding depends on"""
+        if skip_truncation:
+            return f"{self.model_name}|untruncated"
+        return f"{self.model_name}|{self.tokenizer.name}|{self.max_tokens}"
+    
+    def get_model_tokenizer(self):
+        """Return a private copy of the model's own (wordpiece) tokenizer for token-aware chunking"""
+        # encode() sets truncation/padding on the shared fast tokenizer on every call; chunking on
+        # another thread with the same object can fail with "Already borrowed" or run with
+        # truncation enabled and lose the end of the document
+        return copy.deepcopy(self.model.tokenizer)
+    
+    def get_max_seq_length(self) -> int:
+        """Maximum number of model tokens, including special tokens, per input"""
+        return self.model.max_seq_length
     
     def count_tokens(self, text: str) -> int:
         """Count tokens in text"""
@@ -29,15 +78,128 @@ class EmbeddingModel:
         truncated_tokens = tokens[:self.max_tokens]
         return self.tokenizer.decode(truncated_tokens)
     
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def encode(self, texts: List[str], skip_truncation: bool = False) -> List[List[float]]:
+        """Truncate and encode texts with the model, bypassing the cache"""
+        # Truncate texts that exceed token limit, unless they were chunked to fit already
+        if skip_truncation:
+            truncated_texts = texts
+        else:
+            with stage("truncate", batch_size=len(texts)):
+                truncated_texts = [self.truncate_text(text) for text in texts]
+        if self.batch_size == "auto" and len(truncated_texts) >= TUNING_SAMPLE_SIZE:
+            self.tune_batch_size(truncated_texts)
+        batch_size = self.batch_size if isinstance(self.batch_size, int) else 32
+        with stage("encode", batch_size=len(truncated_texts), model_batch_size=batch_size,
+                   processes=self.num_processes):
+            # Small requests such as queries go straight to the model
+            if len(truncated_texts) <= batch_size:
+                embeddings = self.model.encode(truncated_texts, convert_to_tensor=False)
+                return embeddings.tolist()
+            return self.encode_bucketed(truncated_texts, batch_size).tolist()
+    
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Length of each text in model tokens"""
+        encoded = self.length_tokenizer(texts, add_special_tokens=False, truncation=False)
+        return [len(input_ids) for input_ids in encoded["input_ids"]]
+    
+    def encode_bucketed(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Encode texts in batches of similar token length; output keeps the input order"""
+        # Character counts mislead across scripts, so sort by real token counts to minimize padding
+        order = np.argsort(self.token_lengths(texts), kind="stable")
+        sorted_texts = [texts[i] for i in order]
+        
+        if self.num_processes > 1 and len(texts) > batch_size * self.num_processes:
+            # Each worker gets contiguous runs of the sorted list, so its batches stay length-homogeneous
+            sorted_embeddings = self.model.encode_multi_process(
+                sorted_texts,
+                self.get_pool(),
+                batch_size=batch_size,
+                chunk_size=batch_size * 4
+            )
+        else:
+            sorted_embeddings = np.concatenate([
+                self.model.encode(sorted_texts[start:start + batch_size],
+                                  batch_size=batch_size, convert_to_numpy=True)
+                for start in range(0, len(sorted_texts), batch_size)
+            ])
+        
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        return embeddings
+    
+    def tune_batch_size(self, texts: List[str]) -> int:
+        """Pick the batch size with the highest measured throughput on a sample of texts"""
+        sample = texts[:TUNING_SAMPLE_SIZE]
+        order = np.argsort(self.token_lengths(sample), kind="stable")
+        sample = [sample[i] for i in order]
+        best_size, best_rate = BATCH_SIZE_CANDIDATES[0], 0.0
+        for candidate in BATCH_SIZE_CANDIDATES:
+            started = time.perf_counter()
+            for start in range(0, len(sample), candidate):
+                self.model.encode(sample[start:start + candidate], batch_size=candidate, convert_to_numpy=True)
+            rate = len(sample) / max(time.perf_counter() - started, 1e-9)
+            if rate > best_rate:
+                best_size, best_rate = candidate, rate
+        self.batch_size = best_size
+        print(f"Embedding batch size tuned to {best_size} ({best_rate:.0f} texts/sec on one process)")
+        return best_size
+    
+    def get_pool(self):
+        """Start the multi-process encode pool on first use"""
+        if self.pool is None:
+            # Split the cores between workers instead of letting every worker claim all of them
+            threads = str(max(1, (os.cpu_count() or 1) // self.num_processes))
+            previous = os.environ.get("OMP_NUM_THREADS")
+            os.environ["OMP_NUM_THREADS"] = threads
+            try:
+                self.pool = self.model.start_multi_process_pool(["cpu"] * self.num_processes)
+            finally:
+                if previous is None:
+                    del os.environ["OMP_NUM_THREADS"]
+                else:
+                    os.environ["OMP_NUM_THREADS"] = previous
+        return self.pool
+    
+    def close(self):
+        """Stop the multi-process encode pool, if one was started"""
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+    
+    def embed_texts(self, texts: List[str], skip_truncation: bool = False) -> List[List[float]]:
         """Generate embeddings for a list of texts"""
-        # Truncate texts that exceed token limit
-        truncated_texts = [self.truncate_text(text) for text in texts]
-        embeddings = self.model.encode(truncated_texts, convert_to_tensor=False)
-        return embeddings.tolist()
+        if not texts:
+            return []
+        with stage("embed_texts", batch_size=len(texts)) as attributes:
+            if self.cache is None:
+                return self.encode(texts, skip_truncation)
+            embeddings, attributes["cache_hits"] = self._embed_cached(texts, skip_truncation)
+            return embeddings
+    
+    def _embed_cached(self, texts: List[str], skip_truncation: bool) -> Tuple[List[List[float]], int]:
+        """Embed texts through the cache; return the embeddings and how many texts were cached"""
+        namespace = self.cache_namespace(skip_truncation)
+        keys = [EmbeddingCache.make_key(namespace, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        cache_hits = sum(1 for key in keys if key in cached)
+        
+        # Only encode texts that were not cached (each distinct text once)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            new_embeddings = self.encode(list(missing.values()), skip_truncation)
+            computed = dict(zip(missing.keys(), new_embeddings))
+            self.cache.put_many(computed)
+            cached.update(computed)
+        
+        return [cached[key] for key in keys], cache_hits
     
     def embed_query(self, query: str) -> List[float]:
         """Generate embedding for a single query"""
-        truncated_query = self.truncate_text(query)
-        embedding = self.model.encode([truncated_query], convert_to_tensor=False)
-        return embedding[0].tolist()
\ No newline at end of file
+        return self.embed_texts([query])[0]
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Generate embeddings for a batch of queries in one forward pass"""
+        return self.embed_texts(queries)
\ No newline at end of file
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str = "data/embedding_cache",
+                 max_memory_entries: int = 10000, max_disk_entries: int = 500000):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        # float32 arrays take 1.5 KB per 384-dim entry; lists of Python floats take ~12 KB
+        self.memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        
+        # SQLite is shared between Streamlit script threads, so guard it with the lock
+        self.conn = sqlite3.connect(
+            os.path.join(cache_dir, "embeddings.sqlite"),
+            check_same_thread=False
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)"
+        )
+        self.conn.commit()
+        self.disk_entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        """Build a content-addressed key from the model settings and text"""
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{namespace}:{text_hash}"
+    
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Return cached embeddings for the keys that are present"""
+        found: Dict[str, List[float]] = {}
+        with self.lock:
+            disk_keys = []
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key].tolist()
+                else:
+                    disk_keys.append(key)
+            
+            # Look up memory misses on disk in batches (SQLite variable limit)
+            now = time.time()
+            for start in range(0, len(disk_keys), 500):
+                batch = disk_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    embedding = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = embedding.tolist()
+                    self._remember(key, embedding)
+                if rows:
+                    self.conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+            if disk_keys:
+                self.conn.commit()
+            
+            for key in keys:
+                if key in found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found
+    
+    def put_many(self, items: Dict[str, List[float]]):
+        """Store embeddings in memory and on disk"""
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            arrays = {key: np.asarray(embedding, dtype=np.float32) for key, embedding in items.items()}
+            for key, embedding in arrays.items():
+                self._remember(key, embedding)
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, embedding, last_used) VALUES (?, ?, ?)",
+                [(key, embedding.tobytes(), now) for key, embedding in arrays.items()]
+            )
+            self.disk_entries += max(cursor.rowcount, 0)
+            self._evict_disk()
+            self.conn.commit()
+    
+    def _remember(self, key: str, embedding: np.ndarray):
+        """Insert into the in-memory LRU, evicting the least recently used entry"""
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+    
+    def _evict_disk(self):
+        """Drop the least recently used rows once the disk store is over budget"""
+        overflow = self.disk_entries - self.max_disk_entries
+        if overflow > 0:
+            self.disk_entries -= overflow
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and current sizes"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "disk_entries": self.disk_entries
+            }
+    
+    def clear(self):
+        """Remove every cached embedding"""
+        with self.lock:
+            self.memory.clear()
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.commit()
+            self.disk_entries = 0
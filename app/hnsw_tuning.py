@@ -0,0 +1,142 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from vector_store import ChromaBackend, create_backend
+
+def load_embeddings(backend: ChromaBackend, page_size: int = 1000) -> np.ndarray:
+    """Page every stored embedding into one normalized float32 matrix"""
+    pages = []
+    offset = 0
+    while True:
+        page = backend.get(limit=page_size, offset=offset, include=["embeddings"])
+        if not page['ids']:
+            break
+        pages.append(np.asarray(page['embeddings'], dtype=np.float32))
+        offset += len(page['ids'])
+    if not pages:
+        return np.zeros((0, 0), dtype=np.float32)
+    matrix = np.concatenate(pages)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+def exact_neighbours(matrix: np.ndarray, query_rows: np.ndarray, k: int, block_size: int = 64) -> List[List[int]]:
+    """Brute-force top-k rows by cosine similarity, excluding each query's own row"""
+    neighbours = []
+    for start in range(0, len(query_rows), block_size):
+        rows = query_rows[start:start + block_size]
+        scores = matrix[rows] @ matrix.T
+        scores[np.arange(len(rows)), rows] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row_scores, candidates in zip(scores, top):
+            neighbours.append(candidates[np.argsort(-row_scores[candidates])].tolist())
+    return neighbours
+
+def tune_hnsw(matrix: np.ndarray, n_queries: int = 200, k: int = 10,
+              m_values: List[int] = (16, 32), construction_efs: List[int] = (100, 200),
+              search_efs: List[int] = (10, 20, 50, 100, 200), seed: int = 0) -> List[Dict[str, Any]]:
+    """Measure recall@k and query latency of HNSW settings against exact search"""
+    # chroma-hnswlib is the index Chroma itself builds, so results carry over to the collection
+    import hnswlib
+    
+    if len(matrix) <= k:
+        raise ValueError(f"Need more than {k} stored chunks to measure recall@{k}")
+    rng = np.random.default_rng(seed)
+    query_rows = np.sort(rng.choice(len(matrix), size=min(n_queries, len(matrix)), replace=False))
+    exact = exact_neighbours(matrix, query_rows, k)
+    
+    report = []
+    for m, construction_ef in itertools.product(m_values, construction_efs):
+        index = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        index.init_index(max_elements=len(matrix), ef_construction=construction_ef, M=m)
+        started = time.perf_counter()
+        index.add_items(matrix, np.arange(len(matrix)))
+        build_s = time.perf_counter() - started
+        
+        for search_ef in search_efs:
+            index.set_ef(search_ef)
+            latencies = []
+            recalls = []
+            for query_row, reference in zip(query_rows, exact):
+                start = time.perf_counter()
+                labels, _ = index.knn_query(matrix[query_row], k=k + 1)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found = [label for label in labels[0].tolist() if label != query_row][:k]
+                recalls.append(len(set(found) & set(reference)) / k)
+            report.append({
+                "M": m,
+                "construction_ef": construction_ef,
+                "search_ef": search_ef,
+                "recall_at_k": float(np.mean(recalls)),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "build_s": build_s
+            })
+    return report
+
+def recommend(report: List[Dict[str, Any]], target_recall: float) -> Optional[Dict[str, Any]]:
+    """Cheapest setting that meets the target recall"""
+    passing = [row for row in report if row["recall_at_k"] >= target_recall]
+    if not passing:
+        return None
+    # Query work grows with search_ef * M (distance computations); timings on small samples are too noisy to rank by
+    return min(passing, key=lambda row: (row["search_ef"] * row["M"], row["construction_ef"], row["p99_ms"]))
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Tune the Chroma HNSW index: recall@k and latency of each setting against exact search"
+    )
+    parser.add_argument("--persist-directory", default="data/vectors", help="Vector store directory")
+    parser.add_argument("--shard", default=None, help="Tune and rebuild only this shard of a sharded store")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--queries", type=int, default=200, help="Stored chunks sampled as queries")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="Minimum acceptable recall@k")
+    parser.add_argument("--m", type=int, nargs="+", default=[16, 32], help="Graph degrees (M) to try")
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200],
+                        help="Build-time candidate list sizes to try")
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 20, 50, 100, 200],
+                        help="Query-time candidate list sizes to try")
+    parser.add_argument("--apply", action="store_true",
+                        help="Rebuild the collection with the recommended setting")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+    
+    backend = create_backend("chroma", args.persist_directory, shard=args.shard)
+    matrix = load_embeddings(backend)
+    report = tune_hnsw(matrix, args.queries, args.k, args.m, args.construction_ef, args.search_ef)
+    best = recommend(report, args.target_recall)
+    
+    if args.json:
+        print(json.dumps({"current": backend.hnsw, "report": report, "recommended": best}, indent=2))
+    else:
+        print(f"recall@{args.k} over {min(args.queries, len(matrix))} sampled queries, "
+              f"{len(matrix)} chunks; current setting {backend.hnsw}")
+        print(f"{'M':>4}{'constr_ef':>11}{'search_ef':>11}{'recall':>9}{'p50 ms':>9}{'p99 ms':>9}{'build s':>9}")
+        for row in report:
+            print(f"{row['M']:>4}{row['construction_ef']:>11}{row['search_ef']:>11}{row['recall_at_k']:>9.3f}"
+                  f"{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}{row['build_s']:>9.1f}")
+        if best is None:
+            print(f"No setting reached recall@{args.k} >= {args.target_recall}; try larger --search-ef or --m")
+        else:
+            print(f"Recommended: M={best['M']} construction_ef={best['construction_ef']} "
+                  f"search_ef={best['search_ef']} (recall {best['recall_at_k']:.3f}, p99 {best['p99_ms']:.3f} ms)")
+    
+    if args.apply and best is not None:
+        settings = {key: best[key] for key in ("construction_ef", "search_ef", "M")}
+        if settings == backend.hnsw:
+            print("Collection already uses the recommended setting")
+        else:
+            backend.rebuild(settings)
+            print(f"Rebuilt collection with {settings}")
+    return 0 if best is not None else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
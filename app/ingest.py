@@ -1,56 +1,190 @@
-import pdfplumber
 import hashlib
+import multiprocessing
 import os
+import re
 import shutil
-from typing import List, Tuple, Dict, Any
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Tuple, Dict, Any, Optional, Iterable, Iterator, Callable
+
+from telemetry import stage
+
+def extract_pdf_page_range(filepath: str, start: int, end: int) -> List[Tuple[int, str, bool]]:
+    """Extract pages [start, end) in a worker process that opens the PDF on its own"""
+    import pdfplumber
+    
+    pages = []
+    with pdfplumber.open(filepath) as pdf:
+        for index in range(start, end):
+            page = pdf.pages[index]
+            page_text = page.extract_text() or ""
+            has_images = not page_text and bool(page.images)
+            pages.append((index + 1, page_text, has_images))
+            page.flush_cache()
+    return pages
 
 class DocumentIngestor:
-    def __init__(self, upload_dir: str = "data/uploaded_docs"):
+    def __init__(self, upload_dir: str = "data/uploaded_docs", tokenizer=None,
+                 max_tokens: int = 256, token_overlap: int = 32,
+                 extraction_workers: int = 1, pages_per_task: int = 8):
         self.upload_dir = upload_dir
         os.makedirs(upload_dir, exist_ok=True)
         self.chunk_size = 300
         self.overlap = 50
         self.min_chunk_words = 20
+        # Token-aware chunking with the embedding model's own tokenizer
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.token_overlap = token_overlap
+        self.chunking_mode = "tokens" if tokenizer is not None else "words"
+        # Process-pool PDF extraction; 1 worker keeps the serial path
+        self.extraction_workers = max(1, extraction_workers)
+        self.pages_per_task = max(1, pages_per_task)
+        self.io_block_size = 1024 * 1024
     
     def save_uploaded_file(self, uploaded_file) -> str:
         """Save uploaded file and return filepath"""
-        filepath = os.path.join(self.upload_dir, uploaded_file.name)
-        with open(filepath, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        filepath, _ = self.save_uploaded_file_with_hash(uploaded_file)
         return filepath
     
+    def save_uploaded_file_with_hash(self, uploaded_file) -> Tuple[str, str]:
+        """Save uploaded file, hashing it while it is written; return (filepath, file_hash)"""
+        filepath = os.path.join(self.upload_dir, uploaded_file.name)
+        file_hash = hashlib.md5()
+        buffer = uploaded_file.getbuffer()
+        # Hashing happens inside this stage, block by block as the file is written
+        with stage("save_uploaded_file", document_size=len(buffer)):
+            with open(filepath, "wb") as f:
+                for start in range(0, len(buffer), self.io_block_size):
+                    block = buffer[start:start + self.io_block_size]
+                    file_hash.update(block)
+                    f.write(block)
+        return filepath, file_hash.hexdigest()
+    
+    def save_stream_with_hash(self, filename: str, stream) -> Tuple[str, str]:
+        """Save a readable binary stream in blocks while hashing it; return (filepath, file_hash)"""
+        filepath = os.path.join(self.upload_dir, os.path.basename(filename))
+        file_hash = hashlib.md5()
+        with stage("save_uploaded_file") as attributes:
+            with open(filepath, "wb") as f:
+                for block in iter(lambda: stream.read(self.io_block_size), b""):
+                    file_hash.update(block)
+                    f.write(block)
+                attributes["document_size"] = f.tell()
+        return filepath, file_hash.hexdigest()
+    
     def get_file_hash(self, filepath: str) -> str:
         """Generate hash for file content"""
-        with open(filepath, "rb") as f:
-            return hashlib.md5(f.read()).hexdigest()
+        file_hash = hashlib.md5()
+        with stage("hash_file", document_size=os.path.getsize(filepath)):
+            with open(filepath, "rb") as f:
+                for block in iter(lambda: f.read(self.io_block_size), b""):
+                    file_hash.update(block)
+        return file_hash.hexdigest()
     
-    def extract_text_from_pdf(self, filepath: str) -> Tuple[str, bool]:
-        """Extract text from PDF, return (text, is_scanned)"""
-        text = ""
-        is_scanned = False
+    def iter_pdf_pages(self, filepath: str) -> Iterator[Tuple[int, str, bool]]:
+        """Yield (page_number, page_text, has_images) one page at a time"""
+        if self.extraction_workers > 1:
+            page_count = self.get_pdf_page_count(filepath)
+            # Small documents aren't worth the cost of starting worker processes
+            if page_count >= 2 * self.pages_per_task:
+                yield from self._iter_pdf_pages_parallel(filepath, page_count)
+                return
+        yield from self._iter_pdf_pages_serial(filepath)
+    
+    def get_pdf_page_count(self, filepath: str) -> int:
+        """Return the number of pages in a PDF, or 0 if it can't be opened"""
+        import pdfplumber
         
         try:
             with pdfplumber.open(filepath) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                    else:
-                        # Check if page has images (potential scanned content)
-                        if page.images:
-                            is_scanned = True
+                return len(pdf.pages)
+        except Exception:
+            return 0
+    
+    def _iter_pdf_pages_serial(self, filepath: str, start_page: int = 1) -> Iterator[Tuple[int, str, bool]]:
+        """Extract pages in order on the current process"""
+        import pdfplumber
+        
+        try:
+            with pdfplumber.open(filepath) as pdf:
+                for page_number, page in enumerate(pdf.pages[start_page - 1:], start_page):
+                    with stage("extract", page=page_number) as attributes:
+                        page_text = page.extract_text() or ""
+                        # Pages without text but with images are potential scanned content
+                        has_images = not page_text and bool(page.images)
+                        attributes["text_size"] = len(page_text)
+                    yield page_number, page_text, has_images
+                    # Drop pdfplumber's parsed objects so memory stays flat per page
+                    page.flush_cache()
+        except Exception as e:
+            print(f"Error extracting PDF: {e}")
+    
+    def _iter_pdf_pages_parallel(self, filepath: str, page_count: int) -> Iterator[Tuple[int, str, bool]]:
+        """Extract page ranges on a process pool, yielding pages in document order"""
+        ranges = iter([
+            (start, min(start + self.pages_per_task, page_count))
+            for start in range(0, page_count, self.pages_per_task)
+        ])
+        next_page = 1
+        # spawn avoids forking a process that already holds torch and Streamlit threads
+        executor = ProcessPoolExecutor(
+            max_workers=self.extraction_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        try:
+            # Keep a bounded number of ranges in flight so memory stays flat
+            pending = deque()
+            for start, end in ranges:
+                pending.append(executor.submit(extract_pdf_page_range, filepath, start, end))
+                if len(pending) >= 2 * self.extraction_workers:
+                    break
             
-            if not text.strip():
-                is_scanned = True
-                
+            while pending:
+                # Time spent waiting on the workers, i.e. extraction not hidden behind later stages
+                with stage("extract", parallel=True) as attributes:
+                    pages = pending.popleft().result()
+                    attributes["pages"] = len(pages)
+                page_range = next(ranges, None)
+                if page_range:
+                    pending.append(executor.submit(extract_pdf_page_range, filepath, *page_range))
+                for page in pages:
+                    yield page
+                    next_page = page[0] + 1
+        except (BrokenProcessPool, OSError) as e:
+            # The pool itself failed; continue serially from the first missing page
+            print(f"Parallel PDF extraction failed, falling back to serial: {e}")
+            yield from self._iter_pdf_pages_serial(filepath, next_page)
         except Exception as e:
             print(f"Error extracting PDF: {e}")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def extract_text_from_pdf(self, filepath: str) -> Tuple[str, bool]:
+        """Extract text from PDF, return (text, is_scanned)"""
+        page_texts = []
+        is_scanned = False
+        
+        for _, page_text, has_images in self.iter_pdf_pages(filepath):
+            if page_text:
+                page_texts.append(page_text)
+            elif has_images:
+                is_scanned = True
+        
+        text = "\n".join(page_texts)
+        if not text.strip():
             is_scanned = True
         
         return text.strip(), is_scanned
     
     def extract_text_from_txt(self, filepath: str) -> str:
         """Extract text from plain text file"""
+        with stage("extract", document_size=os.path.getsize(filepath)):
+            return self._read_text(filepath)
+    
+    def _read_text(self, filepath: str) -> str:
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 return f.read()
@@ -66,56 +200,264 @@ class DocumentIngestor:
     
     def clean_text(self, text: str) -> str:
         """Clean and normalize text"""
-        # Remove excessive whitespace
-        lines = [line.strip() for line in text.split('\n')]
-        lines = [line for line in lines if line]
-        return '\n'.join(lines)
+        with stage("clean_text", text_size=len(text)):
+            # Remove excessive whitespace
+            lines = [line.strip() for line in text.split('\n')]
+            lines = [line for line in lines if line]
+            return '\n'.join(lines)
     
     def chunk_text(self, text: str) -> List[str]:
         """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
+        with stage("chunk_text", text_size=len(text)) as attributes:
+            words = text.split()
+            chunks = []
+            
+            for i in range(0, len(words), self.chunk_size - self.overlap):
+                chunk_words = words[i:i + self.chunk_size]
+                if len(chunk_words) >= self.min_chunk_words:
+                    chunks.append(' '.join(chunk_words))
+            
+            attributes["chunk_count"] = len(chunks)
+            return chunks
+    
+    def _token_windows(self, text: str, final: bool) -> Tuple[List[Tuple[str, Dict[str, int]]], int, int]:
+        """Return (chunks, next_token, next_char); unless final, stop before an incomplete window"""
+        with stage("chunk_text", text_size=len(text)) as attributes:
+            chunks, next_token, next_char = self._compute_token_windows(text, final)
+            attributes["chunk_count"] = len(chunks)
+            return chunks, next_token, next_char
+    
+    def _compute_token_windows(self, text: str, final: bool) -> Tuple[List[Tuple[str, Dict[str, int]]], int, int]:
+        encoding = self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False
+        )
+        offsets = encoding["offset_mapping"]
+        word_ids = encoding.word_ids()
+        n_tokens = len(offsets)
         
-        for i in range(0, len(words), self.chunk_size - self.overlap):
-            chunk_words = words[i:i + self.chunk_size]
-            if len(chunk_words) >= self.min_chunk_words:
-                chunks.append(' '.join(chunk_words))
+        # Leave room for the [CLS]/[SEP] tokens the model adds when encoding
+        window = self.max_tokens - self.tokenizer.num_special_tokens_to_add()
+        step = max(1, window - self.token_overlap)
         
-        return chunks
-    
-    def process_document(self, filepath: str) -> Tuple[List[str], List[Dict[str, Any]], str]:
-        """Process document and return chunks with metadata"""
-        filename = os.path.basename(filepath)
-        file_hash = self.get_file_hash(filepath)
+        chunks = []
+        start = 0
+        while start < n_tokens:
+            if not final and start + window >= n_tokens:
+                # More text may follow, so this window is not complete yet
+                break
+            end = min(start + window, n_tokens)
+            # Never cut a word in half, so the slice re-tokenizes to the same tokens
+            while end < n_tokens and end > start + 1 and \
+                    word_ids[end] is not None and word_ids[end] == word_ids[end - 1]:
+                end -= 1
+            
+            char_start = offsets[start][0]
+            char_end = offsets[end - 1][1]
+            chunk = text[char_start:char_end]
+            if len(chunk.split()) >= self.min_chunk_words:
+                chunks.append((chunk, {
+                    "token_start": start,
+                    "token_end": end,
+                    "char_start": char_start,
+                    "char_end": char_end
+                }))
+            
+            if end >= n_tokens:
+                start = n_tokens
+                break
+            next_start = max(start + 1, min(start + step, end))
+            # Start the next window at a word boundary as well
+            while next_start < end and word_ids[next_start] is not None and \
+                    word_ids[next_start] == word_ids[next_start - 1]:
+                next_start += 1
+            start = next_start
         
-        # Extract text based on file type
+        next_char = offsets[start][0] if start < n_tokens else len(text)
+        return chunks, start, next_char
+    
+    def iter_document_segments(self, filepath: str) -> Iterator[Tuple[Optional[int], str]]:
+        """Yield (page_number, text) segments; page_number is None for plain text"""
         if filepath.lower().endswith('.pdf'):
-            text, is_scanned = self.extract_text_from_pdf(filepath)
-            if is_scanned and not text.strip():
-                raise ValueError("Scanned image detected; OCR not supported yet")
+            for page_number, page_text, _ in self.iter_pdf_pages(filepath):
+                if page_text:
+                    yield page_number, page_text
         elif filepath.lower().endswith('.txt'):
-            text = self.extract_text_from_txt(filepath)
+            yield None, self.extract_text_from_txt(filepath)
         else:
             raise ValueError("Unsupported file format")
+    
+    def iter_cleaned_segments(self, segments: Iterable[Tuple[Optional[int], str]],
+                              text_sink: Optional[Callable[[str], None]] = None) -> Iterator[Tuple[Optional[int], str, str]]:
+        """Yield (page_number, separator, cleaned_text) for the non-empty pages of the cleaned document"""
+        started = False
+        for page_number, text in segments:
+            cleaned = self.clean_text(text)
+            if not cleaned:
+                continue
+            # Pages are joined with a newline, as clean_text does for the whole document
+            separator = "\n" if started else ""
+            started = True
+            if text_sink is not None:
+                text_sink(separator + cleaned)
+            yield page_number, separator, cleaned
+    
+    def iter_chunks(self, segments: Iterable[Tuple[Optional[int], str]],
+                    text_sink: Optional[Callable[[str], None]] = None) -> Iterator[Tuple[str, Dict[str, int]]]:
+        """Clean and chunk segments incrementally, carrying the overlap across pages"""
+        cleaned_segments = self.iter_cleaned_segments(segments, text_sink)
+        if self.chunking_mode == "tokens":
+            return self._iter_token_chunks(cleaned_segments)
+        return self._iter_word_chunks(cleaned_segments)
+    
+    def _iter_word_chunks(self, cleaned_segments: Iterable[Tuple[Optional[int], str, str]]) -> Iterator[Tuple[str, Dict[str, int]]]:
+        """Word windows identical to chunk_text over the whole document"""
+        step = self.chunk_size - self.overlap
+        # Pending words with their page and start offset in cleaned-document coordinates
+        words: List[str] = []
+        pages: List[Optional[int]] = []
+        starts: List[int] = []
+        # Windows begin at a moving index; consumed words are dropped once per segment
+        start = 0
+        doc_length = 0
         
-        if not text.strip():
-            raise ValueError("No text could be extracted from the document")
+        def make_chunk(end):
+            span = {"char_start": starts[start], "char_end": starts[end - 1] + len(words[end - 1])}
+            if pages[start] is not None:
+                span.update(page_start=pages[start], page_end=pages[end - 1])
+            return ' '.join(words[start:end]), span
         
-        # Clean and chunk text
-        cleaned_text = self.clean_text(text)
-        chunks = self.chunk_text(cleaned_text)
+        for page_number, separator, cleaned in cleaned_segments:
+            base = doc_length + len(separator)
+            doc_length = base + len(cleaned)
+            with stage("chunk_text", text_size=len(cleaned)):
+                for match in re.finditer(r"\S+", cleaned):
+                    words.append(match.group())
+                    starts.append(base + match.start())
+                pages.extend([page_number] * (len(words) - len(pages)))
+            # Only full windows are final until the document ends
+            while len(words) - start >= self.chunk_size:
+                yield make_chunk(start + self.chunk_size)
+                start += step
+            del words[:start], pages[:start], starts[:start]
+            start = 0
         
-        if not chunks:
-            raise ValueError("Document too short to create meaningful chunks")
+        while start < len(words):
+            end = min(start + self.chunk_size, len(words))
+            if end - start >= self.min_chunk_words:
+                yield make_chunk(end)
+            start += step
+    
+    def _iter_token_chunks(self, cleaned_segments: Iterable[Tuple[Optional[int], str, str]]) -> Iterator[Tuple[str, Dict[str, int]]]:
+        """Token windows over the cleaned document, tokenizing only the uncovered tail"""
+        carry = ""
+        carry_char_base = 0
+        carry_token_base = 0
+        doc_length = 0
+        page_offsets: List[int] = []
+        page_numbers: List[Optional[int]] = []
         
-        # Create metadata for each chunk
-        metadatas = []
-        for i, chunk in enumerate(chunks):
-            metadatas.append({
+        def page_at(char_offset: int) -> Optional[int]:
+            return page_numbers[bisect_right(page_offsets, char_offset) - 1]
+        
+        def shift(chunks):
+            for chunk, span in chunks:
+                span["token_start"] += carry_token_base
+                span["token_end"] += carry_token_base
+                span["char_start"] += carry_char_base
+                span["char_end"] += carry_char_base
+                page_start = page_at(span["char_start"])
+                if page_start is not None:
+                    span["page_start"] = page_start
+                    span["page_end"] = page_at(span["char_end"] - 1)
+                yield chunk, span
+        
+        for page_number, separator, cleaned in cleaned_segments:
+            page_offsets.append(doc_length + len(separator))
+            page_numbers.append(page_number)
+            doc_length += len(separator) + len(cleaned)
+            
+            buffer = carry + separator + cleaned
+            chunks, next_token, next_char = self._token_windows(buffer, final=False)
+            yield from shift(chunks)
+            carry = buffer[next_char:]
+            carry_char_base += next_char
+            carry_token_base += next_token
+        
+        if carry.strip():
+            chunks, _, _ = self._token_windows(carry, final=True)
+            yield from shift(chunks)
+    
+    def iter_document_chunks(self, filepath: str, file_hash: Optional[str] = None,
+                             filename: Optional[str] = None,
+                             text_sink: Optional[Callable[[str], None]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Stream (chunk, metadata) pairs: page -> clean -> chunk; text_sink receives the cleaned document"""
+        if filename is None:
+            filename = os.path.basename(filepath)
+        if file_hash is None:
+            file_hash = self.get_file_hash(filepath)
+        
+        has_text = False
+        
+        def tracked_segments():
+            nonlocal has_text
+            for page_number, text in self.iter_document_segments(filepath):
+                if text.strip():
+                    has_text = True
+                yield page_number, text
+        
+        chunk_count = 0
+        # Repeated chunk text within a document is told apart by its occurrence number
+        occurrences: Dict[str, int] = {}
+        for chunk, span in self.iter_chunks(tracked_segments(), text_sink):
+            chunk_count += 1
+            chunk_hash = hashlib.md5(chunk.encode("utf-8")).hexdigest()
+            occurrence = occurrences.get(chunk_hash, 0)
+            occurrences[chunk_hash] = occurrence + 1
+            metadata = {
                 "filename": filename,
-                "chunk_id": i + 1,
+                "chunk_id": chunk_count,
                 "file_hash": file_hash,
-                "word_count": len(chunk.split())
-            })
+                "chunk_hash": chunk_hash,
+                "chunk_occurrence": occurrence,
+                "word_count": len(chunk.split()),
+                "chunking": self.chunking_mode
+            }
+            metadata.update(span)
+            yield chunk, metadata
+        
+        if not has_text:
+            if filepath.lower().endswith('.pdf'):
+                raise ValueError("Scanned image detected; OCR not supported yet")
+            raise ValueError("No text could be extracted from the document")
+        if chunk_count == 0:
+            raise ValueError("Document too short to create meaningful chunks")
+    
+    def iter_document_batches(self, filepath: str, batch_size: int = 64, file_hash: Optional[str] = None,
+                              filename: Optional[str] = None,
+                              text_sink: Optional[Callable[[str], None]] = None) -> Iterator[Tuple[List[str], List[Dict[str, Any]]]]:
+        """Stream the document's chunks in (chunks, metadatas) batches"""
+        chunks: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        for chunk, metadata in self.iter_document_chunks(filepath, file_hash, filename, text_sink):
+            chunks.append(chunk)
+            metadatas.append(metadata)
+            if len(chunks) >= batch_size:
+                yield chunks, metadatas
+                chunks, metadatas = [], []
+        if chunks:
+            yield chunks, metadatas
+    
+    def process_document(self, filepath: str) -> Tuple[List[str], List[Dict[str, Any]], str]:
+        """Process document and return chunks with metadata"""
+        file_hash = self.get_file_hash(filepath)
+        
+        chunks = []
+        metadatas = []
+        for chunk, metadata in self.iter_document_chunks(filepath, file_hash):
+            chunks.append(chunk)
+            metadatas.append(metadata)
         
-        return chunks, metadatas, file_hash
\ No newline at end of file
+        return chunks, metadatas, file_hash
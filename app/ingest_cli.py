@@ -0,0 +1,306 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from pipeline import IngestionPipeline, embed_batches, start_document_update
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+
+# Marks the end of a stage's output
+_END = object()
+
+def discover_files(directory: str) -> List[str]:
+    """Find every supported document below directory, in a stable order"""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                found.append(os.path.join(root, name))
+    return found
+
+class IngestStats:
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.files_done = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.chunks = 0
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+    
+    def add(self, **counts: int):
+        """Increment counters from any stage thread"""
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+    
+    def report(self) -> str:
+        """Format throughput so far"""
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        processed = self.files_done + self.files_skipped + self.files_failed
+        return (
+            f"{processed}/{self.total_files} files "
+            f"({self.files_done} ingested, {self.files_skipped} skipped, {self.files_failed} failed) | "
+            f"{self.files_done / elapsed:.2f} files/sec | "
+            f"{self.chunks} chunks, {self.chunks / elapsed:.1f} chunks/sec | "
+            f"{elapsed:.0f}s elapsed"
+        )
+
+class BulkIngestor:
+    def __init__(self, document_ingestor, embedding_model, vector_store, batch_size: int = 64,
+                 queue_size: int = 8, extract_workers: int = 2, report_interval: float = 10.0,
+                 embed_window: int = 512, text_store=None):
+        self.document_ingestor = document_ingestor
+        self.embedding_model = embedding_model
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.extract_workers = max(1, extract_workers)
+        self.report_interval = report_interval
+        # Most chunks handed to the model in one encode call
+        self.embed_window = max(batch_size, embed_window)
+        self.text_store = text_store
+    
+    def run(self, directory: str) -> IngestStats:
+        """Ingest every document in directory with overlapping extract/embed/store stages"""
+        files = discover_files(directory)
+        stats = IngestStats(len(files))
+        
+        file_queue: "queue.Queue" = queue.Queue()
+        for filepath in files:
+            file_queue.put(filepath)
+        # Bounded queues apply backpressure so extraction can't run far ahead of the model
+        chunk_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        embedded_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        
+        extractors = [
+            threading.Thread(
+                target=self._extract_stage,
+                args=(directory, file_queue, chunk_queue, stats),
+                name=f"extract-{i}",
+                daemon=True
+            )
+            for i in range(self.extract_workers)
+        ]
+        embedder = threading.Thread(
+            target=self._embed_stage,
+            args=(chunk_queue, embedded_queue),
+            name="embed",
+            daemon=True
+        )
+        for thread in extractors:
+            thread.start()
+        embedder.start()
+        
+        self._store_stage(embedded_queue, stats)
+        
+        for thread in extractors:
+            thread.join()
+        embedder.join()
+        print(stats.report())
+        return stats
+    
+    def _extract_stage(self, directory: str, file_queue: "queue.Queue",
+                       chunk_queue: "queue.Queue", stats: IngestStats):
+        """Hash, resume-check, extract and chunk files into batches"""
+        try:
+            while True:
+                try:
+                    filepath = file_queue.get_nowait()
+                except queue.Empty:
+                    break
+                
+                # Relative paths keep chunk IDs unique across subdirectories; the top-level
+                # directory doubles as the tenant when the store is sharded by group
+                filename = os.path.relpath(filepath, directory).replace(os.sep, "/")
+                update = None
+                try:
+                    file_hash = self.document_ingestor.get_file_hash(filepath)
+                    if self.vector_store.is_file_ingested(file_hash):
+                        stats.add(files_skipped=1)
+                        continue
+                    # Diffing against stored chunks also picks up leftovers of a crashed run
+                    update = start_document_update(self.vector_store, filename, file_hash, self.text_store)
+                    
+                    for chunks, metadatas in self.document_ingestor.iter_document_batches(
+                            filepath, self.batch_size, file_hash, filename, update.text_sink()):
+                        ids = IngestionPipeline.make_chunk_ids(metadatas)
+                        chunk_queue.put(("batch", filename, update, chunks, metadatas, ids))
+                    chunk_queue.put(("done", filename, update))
+                except Exception as e:
+                    chunk_queue.put(("failed", filename, update, e))
+        finally:
+            chunk_queue.put(_END)
+    
+    def _embed_stage(self, chunk_queue: "queue.Queue", embedded_queue: "queue.Queue"):
+        """Embed new chunk batches as soon as they are extracted"""
+        skip_truncation = self.document_ingestor.chunking_mode == "tokens"
+        finished_extractors = 0
+        try:
+            while finished_extractors < self.extract_workers:
+                items = [chunk_queue.get()]
+                # Combine batches that are already waiting into one larger encode call
+                pending_chunks = self._batch_size_of(items[0])
+                while pending_chunks < self.embed_window:
+                    try:
+                        item = chunk_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    items.append(item)
+                    pending_chunks += self._batch_size_of(item)
+                
+                finished_extractors += sum(1 for item in items if item is _END)
+                self._embed_items([item for item in items if item is not _END], embedded_queue, skip_truncation)
+        finally:
+            embedded_queue.put(_END)
+    
+    @staticmethod
+    def _batch_size_of(item) -> int:
+        return len(item[3]) if item is not _END and item[0] == "batch" else 0
+    
+    def _embed_items(self, items: List[tuple], embedded_queue: "queue.Queue", skip_truncation: bool):
+        """Embed the batch items together and pass everything on in the original order"""
+        batches = [(item[2], item[3], item[5]) for item in items if item[0] == "batch"]
+        try:
+            embedded = iter(embed_batches(self.embedding_model, batches, skip_truncation))
+        except Exception:
+            # Retry file by file so one bad batch doesn't fail the others it was combined with
+            embedded = None
+        
+        for item in items:
+            if item[0] != "batch":
+                embedded_queue.put(item)
+                continue
+            _, filename, update, chunks, metadatas, ids = item
+            try:
+                embeddings = next(embedded) if embedded is not None else \
+                    update.embed_batch(self.embedding_model, chunks, ids, skip_truncation)
+            except Exception as e:
+                embedded_queue.put(("failed", filename, update, e))
+                continue
+            embedded_queue.put(("batch", filename, update, chunks, metadatas, ids, embeddings))
+    
+    def _store_stage(self, embedded_queue: "queue.Queue", stats: IngestStats):
+        """Write embedded batches to the vector store and track per-file completion"""
+        failed = set()
+        last_report = time.perf_counter()
+        
+        while True:
+            try:
+                item = embedded_queue.get(timeout=self.report_interval)
+            except queue.Empty:
+                item = None
+            
+            now = time.perf_counter()
+            if now - last_report >= self.report_interval:
+                print(stats.report())
+                last_report = now
+            
+            if item is None:
+                continue
+            if item is _END:
+                break
+            
+            kind, filename, update = item[0], item[1], item[2]
+            if filename in failed:
+                continue
+            
+            try:
+                if kind == "batch":
+                    chunks, metadatas, ids, embeddings = item[3], item[4], item[5], item[6]
+                    update.store_batch(chunks, embeddings, metadatas, ids)
+                    stats.add(chunks=len(chunks))
+                elif kind == "done":
+                    update.finish()
+                    stats.add(files_done=1)
+                else:
+                    raise item[3]
+            except Exception as e:
+                print(f"Error ingesting {filename}: {e}")
+                failed.add(filename)
+                stats.add(files_failed=1)
+                if update is not None:
+                    try:
+                        update.abort()
+                    except Exception as cleanup_error:
+                        print(f"Error removing partial chunks of {filename}: {cleanup_error}")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Bulk-ingest a directory of PDF and TXT documents into the vector store"
+    )
+    parser.add_argument("directory", help="Directory to scan recursively for .pdf and .txt files")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embed/store batch")
+    parser.add_argument("--queue-size", type=int, default=8, help="Batches buffered between stages")
+    parser.add_argument("--extract-workers", type=int, default=2, help="Parallel file extraction threads")
+    parser.add_argument("--pdf-workers", type=int, default=1,
+                        help="Processes used to extract pages of a single large PDF")
+    parser.add_argument("--embed-window", type=int, default=512,
+                        help="Most queued chunks combined into one encode call")
+    parser.add_argument("--embed-batch-size", default="auto",
+                        help="Model batch size, or 'auto' to measure the fastest on this machine")
+    parser.add_argument("--embed-processes", type=int, default=1,
+                        help="Encode worker processes (e.g. the number of CPU cores)")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress reports")
+    parser.add_argument("--persist-directory", default="data/vectors", help="Vector store directory")
+    parser.add_argument("--text-storage", choices=["inline", "blob"], default=None,
+                        help="Store chunk text in the vector store, or once per document in a compressed blob store "
+                             "(default: TEXT_STORAGE or inline)")
+    parser.add_argument("--text-store-dir", default=None,
+                        help="Blob store directory (default: TEXT_STORE_DIR or data/text_store)")
+    parser.add_argument("--dedup-threshold", type=float, default=None,
+                        help="Link chunks at least this similar (0-1) to a stored chunk instead of embedding them "
+                             "(default: DEDUP_THRESHOLD)")
+    parser.add_argument("--dedup-dir", default=None,
+                        help="Near-duplicate index directory (default: DEDUP_DIR or data/dedup)")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.directory):
+        parser.error(f"Not a directory: {args.directory}")
+    
+    from components import create_text_store, create_vector_store
+    from ingest import DocumentIngestor
+    from embed import EmbeddingModel
+    from telemetry import setup_telemetry
+    
+    setup_telemetry()
+    
+    # Backend, sharding, quantization, HNSW and text storage settings come from the environment, as in the app
+    text_store = create_text_store(args.text_storage, args.text_store_dir)
+    vector_store = create_vector_store(args.persist_directory, args.dedup_threshold, args.dedup_dir, text_store)
+    embed_batch_size = args.embed_batch_size if args.embed_batch_size == "auto" else int(args.embed_batch_size)
+    embedding_model = EmbeddingModel(batch_size=embed_batch_size, num_processes=args.embed_processes)
+    document_ingestor = DocumentIngestor(
+        tokenizer=embedding_model.get_model_tokenizer(),
+        max_tokens=embedding_model.get_max_seq_length(),
+        extraction_workers=args.pdf_workers
+    )
+    
+    bulk_ingestor = BulkIngestor(
+        document_ingestor,
+        embedding_model,
+        vector_store,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        extract_workers=args.extract_workers,
+        report_interval=args.report_interval,
+        embed_window=args.embed_window,
+        text_store=text_store
+    )
+    try:
+        stats = bulk_ingestor.run(args.directory)
+    finally:
+        embedding_model.close()
+    return 1 if stats.files_failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
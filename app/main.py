@@ -6,6 +6,9 @@ from pathlib import Path
 # Add app directory to path
 sys.path.append(str(Path(__file__).parent))
 
+from telemetry import TimingBreakdown, collect_timings
+from text_store import fill_chunk_documents
+
 def main():
     st.set_page_config(
         page_title="Vector QA App",
@@ -16,27 +19,38 @@ def main():
     st.title("📚 Document-Based Question Answering")
     st.markdown("Upload PDF or text documents and ask questions in Bangla or English")
     
-    # Initialize components with caching
+    # Initialize components with caching; the model keeps loading in the background
     @st.cache_resource
     def load_components():
-        from ingest import DocumentIngestor
-        from embed import EmbeddingModel
-        from vector_store import VectorStore
-        from search import SearchEngine
-        
-        vector_store = VectorStore()
-        embedding_model = EmbeddingModel()
-        document_ingestor = DocumentIngestor()
-        search_engine = SearchEngine(vector_store, embedding_model)
-        return vector_store, embedding_model, document_ingestor, search_engine
+        from components import ComponentLoader
+        return ComponentLoader().start()
+    
+    def wait_for_model():
+        """Block until the embedding model is ready and return all components"""
+        with st.spinner("Waiting for the embedding model to finish loading..."):
+            return component_loader.wait()
+    
+    def show_timings(timings: TimingBreakdown):
+        """Per-stage time of the last request; outer stages include the stages inside them"""
+        rows = timings.rows()
+        if rows:
+            with st.expander("⏱️ Timing breakdown"):
+                st.table(rows)
     
     try:
-        vector_store, embedding_model, document_ingestor, search_engine = load_components()
-        st.success("✅ All components loaded successfully!")
+        component_loader = load_components()
+        vector_store = component_loader.vector_store
+        status = component_loader.get_status()
+        if status["error"]:
+            raise RuntimeError(status["error"])
+        if status["ready"]:
+            st.success(f"✅ All components loaded successfully! (startup {status['timings']['total_s']:.1f}s)")
+        else:
+            st.info("⏳ The embedding model is loading in the background. Upload and search will wait for it.")
         
     except Exception as e:
         st.error(f"❌ Error loading components: {str(e)}")
-        st.info("Please ensure all dependencies are installed: pip install chromadb sentence-transformers pdfplumber tiktoken scikit-learn")
+        st.info("Please ensure all dependencies are installed: pip install chromadb sentence-transformers pdfplumber tiktoken")
         st.stop()
     
     # Sidebar for document upload
@@ -53,26 +67,40 @@ def main():
             if st.button("Process Document"):
                 with st.spinner("Processing document..."):
                     try:
-                        # Save uploaded file
-                        filepath = document_ingestor.save_uploaded_file(uploaded_file)
+                        _, _, document_ingestor, _, ingestion_pipeline = wait_for_model()
                         
-                        # Check if document already exists
-                        if vector_store.document_exists(uploaded_file.name):
-                            st.warning("Document already processed. Skipping duplicate.")
+                        timings = TimingBreakdown()
+                        # Save uploaded file, hashing it while it is written
+                        with collect_timings(timings):
+                            filepath, file_hash = document_ingestor.save_uploaded_file_with_hash(uploaded_file)
+                        
+                        # Check if this exact content was already ingested
+                        if vector_store.is_file_ingested(file_hash):
+                            existing_names = vector_store.get_filenames_for_hash(file_hash)
+                            if uploaded_file.name in existing_names:
+                                st.warning("Document already processed. Skipping duplicate.")
+                            else:
+                                st.warning(f"Same content already processed as {', '.join(existing_names)}. Skipping duplicate.")
                         else:
-                            # Process document
-                            chunks, metadatas, file_hash = document_ingestor.process_document(filepath)
+                            # Stream pages through chunking, embedding and storage; only changed chunks are embedded
+                            progress = st.empty()
                             
-                            # Generate embeddings
-                            embeddings = embedding_model.embed_texts(chunks)
+                            def report_progress(chunk_count, page_number):
+                                page_info = f" (page {page_number})" if page_number else ""
+                                progress.caption(f"Processed {chunk_count} chunks{page_info}...")
                             
-                            # Create IDs for chunks
-                            ids = [f"{uploaded_file.name}_{i}" for i in range(len(chunks))]
+                            with collect_timings(timings):
+                                summary = ingestion_pipeline.ingest_file(
+                                    filepath, file_hash, progress_callback=report_progress
+                                )
+                            progress.empty()
                             
-                            # Store in vector database
-                            vector_store.add_chunks(chunks, embeddings, metadatas, ids)
-                            
-                            st.success(f"✅ Processed {len(chunks)} chunks from {uploaded_file.name}")
+                            st.success(
+                                f"✅ Processed {summary['chunks']} chunks from {uploaded_file.name} "
+                                f"({summary['added']} new, {summary['linked']} linked duplicates, "
+                                f"{summary['unchanged']} unchanged, {summary['removed']} removed)"
+                            )
+                            show_timings(timings)
                             
                     except Exception as e:
                         st.error(f"Error processing document: {str(e)}")
@@ -86,6 +114,42 @@ def main():
         except:
             st.metric("Total Chunks", "N/A")
         
+        if component_loader.is_ready():
+            search_engine = component_loader.components[3]
+            cache_stats = search_engine.result_cache.get_stats()
+            lookups = cache_stats["hits"] + cache_stats["misses"]
+            st.metric(
+                "Result Cache Hit Rate",
+                f"{cache_stats['hit_rate']:.0%}" if lookups else "N/A",
+                help=f"{cache_stats['hits']} hits / {lookups} searches, {cache_stats['entries']} cached queries"
+            )
+        
+        if vector_store.dedup_index is not None:
+            dedup_stats = vector_store.dedup_index.get_stats()
+            st.metric(
+                "Linked Duplicates",
+                dedup_stats["linked_duplicates"],
+                help="Chunks reusing the embedding of a near-identical stored chunk"
+            )
+        
+        shard_names = vector_store.shard_names()
+        if shard_names:
+            st.metric("Shards", len(shard_names))
+            # Clearing one shard leaves every other shard's index untouched
+            shard_to_clear = st.selectbox("Shard", shard_names, key="shard_to_clear")
+            if st.button("🧹 Clear Shard", type="secondary"):
+                if st.session_state.get('confirm_clear_shard') == shard_to_clear:
+                    try:
+                        vector_store.clear_shard(shard_to_clear)
+                        st.success(f"✅ Shard {shard_to_clear} cleared successfully!")
+                        st.session_state.confirm_clear_shard = None
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error clearing shard: {str(e)}")
+                else:
+                    st.session_state.confirm_clear_shard = shard_to_clear
+                    st.warning(f"⚠️ Click again to confirm clearing shard {shard_to_clear}")
+        
         # Clear all documents button
         if st.button("🗑️ Clear All Documents", type="secondary"):
             if st.session_state.get('confirm_clear', False):
@@ -103,9 +167,9 @@ def main():
         # View all chunks button
         if st.button("📋 View All Chunks"):
             try:
-                all_chunks = vector_store.get_all_chunks()
-                if all_chunks and all_chunks.get('documents'):
+                if vector_store.get_collection_count() > 0:
                     st.session_state.show_chunks = True
+                    st.session_state.chunk_page = 1
                     st.rerun()
                 else:
                     st.info("No chunks found")
@@ -127,10 +191,21 @@ def main():
     with col2:
         top_k = st.slider("Number of results", 1, 20, 5)
     
+    search_shards = None
+    if vector_store.shard_names():
+        search_shards = st.multiselect(
+            "Search in shards",
+            vector_store.shard_names(),
+            help="Leave empty to search every shard"
+        ) or None
+    
     if search_button and query:
         with st.spinner("Searching..."):
             try:
-                results = search_engine.search_documents(query, top_k=top_k)
+                _, _, _, search_engine, _ = wait_for_model()
+                with collect_timings() as timings:
+                    results = search_engine.search_documents(query, top_k=top_k, shards=search_shards)
+                show_timings(timings)
                 
                 if results and "error" in results[0]:
                     st.warning(results[0]["error"])
@@ -176,13 +251,37 @@ def main():
     if st.session_state.get('show_chunks', False):
         st.header("📋 All Document Chunks")
         try:
-            all_chunks = vector_store.get_all_chunks()
-            if all_chunks and all_chunks.get('documents') and len(all_chunks['documents']) > 0:
-                st.write(f"Total chunks: {len(all_chunks['documents'])}")
-                for i, (doc, metadata, chunk_id) in enumerate(zip(all_chunks['documents'], all_chunks['metadatas'], all_chunks['ids'])):
-                    with st.expander(f"Chunk {i+1}: {metadata.get('filename', 'Unknown')} (ID: {chunk_id})", expanded=False):
+            # Chunk counts come from metadata only; documents are fetched one page at a time
+            file_counts = vector_store.get_file_chunk_counts()
+            total_chunks = sum(file_counts.values())
+            if total_chunks > 0:
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    file_options = ["All documents"] + sorted(file_counts)
+                    selected_file = st.selectbox(
+                        "Document",
+                        file_options,
+                        format_func=lambda name: name if name == "All documents" else f"{name} ({file_counts[name]} chunks)"
+                    )
+                with col2:
+                    page_size = st.selectbox("Chunks per page", [10, 20, 50], index=1)
+                
+                filename = None if selected_file == "All documents" else selected_file
+                chunk_count = total_chunks if filename is None else file_counts[filename]
+                page_count = max(1, -(-chunk_count // page_size))
+                page = st.number_input("Page", min_value=1, max_value=page_count,
+                                       value=min(st.session_state.get('chunk_page', 1), page_count))
+                st.session_state.chunk_page = page
+                st.write(f"Total chunks: {chunk_count} (page {page} of {page_count})")
+                
+                offset = (page - 1) * page_size
+                chunk_page = vector_store.get_chunks_page(limit=page_size, offset=offset, filename=filename)
+                documents = fill_chunk_documents(component_loader.text_store, chunk_page['documents'],
+                                                 chunk_page['metadatas'])
+                for i, (doc, metadata, chunk_id) in enumerate(zip(documents, chunk_page['metadatas'], chunk_page['ids'])):
+                    with st.expander(f"Chunk {offset + i + 1}: {metadata.get('filename', 'Unknown')} (ID: {chunk_id})", expanded=False):
                         st.write(f"**Words:** {metadata.get('word_count', 'N/A')}")
-                        st.text_area("Content:", doc, height=150, disabled=True, key=f"chunk_{i}")
+                        st.text_area("Content:", doc, height=150, disabled=True, key=f"chunk_{chunk_id}")
                 if st.button("Hide Chunks"):
                     st.session_state.show_chunks = False
                     st.rerun()
@@ -207,9 +306,9 @@ def main():
         
         ### 🔍 Features:
         - **Bangla & English Support**: Full Unicode support for both languages
-        - **Smart Chunking**: Documents split into ~500-word overlapping sections
+        - **Smart Chunking**: Documents split into overlapping sections that fit the embedding model's token limit
         - **Similarity Scoring**: Results ranked by cosine similarity
-        - **Duplicate Detection**: Skips already processed documents
+        - **Duplicate Detection**: Skips already processed content and only re-embeds changed chunks of edited files
         - **Edge Case Handling**: Handles scanned PDFs, short chunks, etc.
         
         ### 📊 Similarity Scores:
@@ -0,0 +1,391 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process lock, so only one process may write to a store at a time
+    fcntl = None
+
+from quantization import QuantizedIndex
+from vector_store import VectorBackend
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate the subset of Chroma's where-filter syntax used by this app"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class NumpyBackend(VectorBackend):
+    """Exact cosine search over a memory-mapped matrix of normalized embeddings"""
+    
+    def __init__(self, persist_directory: str, dtype: str = "float16", initial_capacity: int = 1024,
+                 block_rows: int = 65536, quantization: Optional[str] = None, rerank_factor: int = 4):
+        self.persist_directory = persist_directory
+        self.block_rows = block_rows
+        # Two-stage retrieval: quantized candidate scan, then exact rerank from the matrix
+        self.quantization = quantization
+        self.rerank_factor = max(1, rerank_factor)
+        self.quantized: Optional[QuantizedIndex] = None
+        os.makedirs(persist_directory, exist_ok=True)
+        self.matrix_path = os.path.join(persist_directory, "embeddings.bin")
+        self.lock = threading.RLock()
+        self.initial_capacity = initial_capacity
+        # The app and the bulk CLI may open the same store: writers take the file lock exclusively,
+        # readers shared, and each reloads its row bookkeeping after another process committed
+        self.lock_file = open(os.path.join(persist_directory, "store.lock"), "a+")
+        self.lock_depth = 0
+        
+        # Documents and metadata live in a compact SQLite side file keyed by matrix row
+        self.conn = sqlite3.connect(
+            os.path.join(persist_directory, "records.sqlite"),
+            check_same_thread=False
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, document TEXT, metadata TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+        
+        self.dtype = np.dtype(dtype)
+        self.matrix: Optional[np.memmap] = None
+        self.data_version: Optional[int] = None
+        with self._locked(exclusive=False):
+            # The first acquisition loads the row bookkeeping
+            pass
+    
+    def _load(self):
+        """Read row bookkeeping from disk"""
+        settings = dict(self.conn.execute("SELECT key, value FROM settings").fetchall())
+        # An existing matrix keeps the dtype it was created with
+        self.dtype = np.dtype(settings.get("dtype", self.dtype.name))
+        self.dim = int(settings["dim"]) if "dim" in settings else None
+        self.capacity = int(settings.get("capacity", 0))
+        self.matrix = None
+        if self.dim is not None and self.capacity:
+            self.matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r+",
+                                    shape=(self.capacity, self.dim))
+        
+        # Row bookkeeping and metadata are small enough to keep in memory for filtering
+        self.id_to_row: Dict[str, int] = {}
+        self.row_to_id: Dict[int, str] = {}
+        self.row_metadata: Dict[int, Dict[str, Any]] = {}
+        for row, chunk_id, metadata in self.conn.execute("SELECT row, id, metadata FROM chunks"):
+            self.id_to_row[chunk_id] = row
+            self.row_to_id[row] = chunk_id
+            self.row_metadata[row] = json.loads(metadata)
+        self.next_row = max(self.row_metadata, default=-1) + 1
+        self.alive = np.zeros(self.capacity, dtype=bool)
+        if self.row_metadata:
+            self.alive[list(self.row_metadata)] = True
+        self.quantized = None
+        if self.quantization and self.matrix is not None:
+            self.quantized = self.build_quantized_index(self.quantization)
+    
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        """Hold the thread lock and the store's file lock, reloading first if another process wrote"""
+        with self.lock:
+            outermost = self.lock_depth == 0
+            if outermost and fcntl is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self.lock_depth += 1
+            try:
+                if outermost:
+                    # data_version only changes when another connection commits
+                    data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+                    if data_version != self.data_version:
+                        self._load()
+                        self.data_version = data_version
+                yield
+            finally:
+                self.lock_depth -= 1
+                if outermost and fcntl is not None:
+                    fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+    
+    def build_quantized_index(self, level: str) -> QuantizedIndex:
+        """Quantize the stored matrix block by block"""
+        index = QuantizedIndex(level, self.dim)
+        index.resize(self.capacity)
+        for start in range(0, self.next_row, self.block_rows):
+            end = min(start + self.block_rows, self.next_row)
+            index.set_rows(start, np.asarray(self.matrix[start:end], dtype=np.float32))
+        return index
+    
+    def _save_setting(self, key: str, value: Any):
+        self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+    
+    def _ensure_capacity(self, rows_needed: int, dim: int):
+        """Grow the memory-mapped file by doubling when it runs out of rows"""
+        if self.dim is None:
+            self.dim = dim
+            self._save_setting("dim", dim)
+            self._save_setting("dtype", self.dtype.name)
+        elif dim != self.dim:
+            raise ValueError(f"Embedding dimension {dim} does not match stored dimension {self.dim}")
+        
+        if rows_needed <= self.capacity:
+            return
+        new_capacity = max(self.initial_capacity, self.capacity)
+        while new_capacity < rows_needed:
+            new_capacity *= 2
+        
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * self.dtype.itemsize)
+        self.matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r+",
+                                shape=(new_capacity, self.dim))
+        self.alive = np.concatenate([self.alive, np.zeros(new_capacity - self.capacity, dtype=bool)])
+        self.capacity = new_capacity
+        self._save_setting("capacity", new_capacity)
+        if self.quantized is not None:
+            self.quantized.resize(new_capacity)
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+    
+    def add(self, ids, documents, embeddings, metadatas):
+        with self._locked(exclusive=True):
+            # Like Chroma, existing IDs are left untouched
+            new = [i for i, chunk_id in enumerate(ids) if chunk_id not in self.id_to_row]
+            if not new:
+                return
+            vectors = self._normalize(np.asarray([embeddings[i] for i in new], dtype=np.float32))
+            start = self.next_row
+            self._ensure_capacity(start + len(new), vectors.shape[1])
+            self.matrix[start:start + len(new)] = vectors.astype(self.dtype)
+            self.matrix.flush()
+            if self.quantization:
+                if self.quantized is None:
+                    self.quantized = QuantizedIndex(self.quantization, self.dim)
+                    self.quantized.resize(self.capacity)
+                self.quantized.set_rows(start, vectors)
+            
+            records = []
+            for offset, i in enumerate(new):
+                row = start + offset
+                self.id_to_row[ids[i]] = row
+                self.row_to_id[row] = ids[i]
+                self.row_metadata[row] = metadatas[i]
+                records.append((row, ids[i], documents[i], json.dumps(metadatas[i], ensure_ascii=False)))
+            self.alive[start:start + len(new)] = True
+            self.next_row = start + len(new)
+            self.conn.executemany(
+                "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)", records
+            )
+            self.conn.commit()
+    
+    def query(self, query_embeddings, n_results):
+        with self._locked(exclusive=False):
+            queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+            k = min(n_results, len(self.id_to_row))
+            empty = {"ids": [[] for _ in queries], "documents": [[] for _ in queries],
+                     "metadatas": [[] for _ in queries], "distances": [[] for _ in queries]}
+            if k == 0 or self.matrix is None:
+                return empty
+            
+            if self.quantized is not None:
+                top_rows, top_scores = self.two_stage_top_k(queries, k, self.quantized, self.rerank_factor)
+            else:
+                top_rows, top_scores = self.exact_top_k(queries, k)
+            
+            documents = self._load_documents({int(row) for row in top_rows.ravel()})
+            results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            for rows, row_scores in zip(top_rows, top_scores):
+                alive = [(int(row), float(score)) for row, score in zip(rows, row_scores)
+                         if np.isfinite(score)]
+                results["ids"].append([self.row_to_id[row] for row, _ in alive])
+                results["documents"].append([documents[row] for row, _ in alive])
+                results["metadatas"].append([self.row_metadata[row] for row, _ in alive])
+                # Same cosine distance Chroma reports
+                results["distances"].append([1.0 - score for _, score in alive])
+            return results
+    
+    def exact_scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of each normalized query to every row; deleted rows get -inf"""
+        n_rows = self.next_row
+        # One matmul per block of rows for the whole batch: (queries x dim) @ (dim x rows)
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, self.block_rows):
+            block = np.asarray(self.matrix[start:min(start + self.block_rows, n_rows)], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        scores[:, ~self.alive[:n_rows]] = -np.inf
+        return scores
+    
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int):
+        """Return (rows, scores) of the k highest scores per query, best first"""
+        if k < scores.shape[1]:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+    
+    def exact_top_k(self, queries: np.ndarray, k: int):
+        """Brute-force top-k over the full-precision matrix"""
+        return self._top_k(self.exact_scores(queries), k)
+    
+    def two_stage_top_k(self, queries: np.ndarray, k: int, quantized: QuantizedIndex, rerank_factor: int):
+        """Scan quantized codes for k * rerank_factor candidates, then rerank them exactly"""
+        n_rows = self.next_row
+        approximate = quantized.approximate_scores(queries, n_rows)
+        approximate[:, ~self.alive[:n_rows]] = -np.inf
+        candidates, _ = self._top_k(approximate, min(n_rows, k * rerank_factor))
+        
+        top_rows = np.empty((len(queries), k), dtype=np.int64)
+        top_scores = np.empty((len(queries), k), dtype=np.float32)
+        for i, rows in enumerate(candidates):
+            # Only the candidate rows of the memory-mapped matrix are read
+            rows = np.sort(rows)
+            exact = np.asarray(self.matrix[rows], dtype=np.float32) @ queries[i]
+            exact[~self.alive[rows]] = -np.inf
+            best, best_scores = self._top_k(exact[None, :], k)
+            top_rows[i] = rows[best[0]]
+            top_scores[i] = best_scores[0]
+        return top_rows, top_scores
+    
+    def _load_documents(self, rows) -> Dict[int, str]:
+        documents = {}
+        rows = list(rows)
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for row, document in self.conn.execute(
+                    f"SELECT row, document FROM chunks WHERE row IN ({placeholders})", batch):
+                documents[row] = document
+        return documents
+    
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        if include is None:
+            include = ["metadatas", "documents"]
+        with self._locked(exclusive=False):
+            if ids is not None:
+                rows = [self.id_to_row[chunk_id] for chunk_id in ids if chunk_id in self.id_to_row]
+            else:
+                rows = sorted(self.row_metadata)
+            rows = [row for row in rows if matches_where(self.row_metadata[row], where)]
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            
+            results: Dict[str, Any] = {
+                "ids": [self.row_to_id[row] for row in rows],
+                "documents": None,
+                "metadatas": None,
+                "embeddings": None
+            }
+            if "documents" in include:
+                documents = self._load_documents(rows)
+                results["documents"] = [documents[row] for row in rows]
+            if "metadatas" in include:
+                results["metadatas"] = [self.row_metadata[row] for row in rows]
+            if "embeddings" in include:
+                results["embeddings"] = [np.asarray(self.matrix[row], dtype=np.float32).tolist() for row in rows]
+            return results
+    
+    def update(self, ids, metadatas):
+        with self._locked(exclusive=True):
+            records = []
+            for chunk_id, metadata in zip(ids, metadatas):
+                row = self.id_to_row.get(chunk_id)
+                if row is None:
+                    continue
+                self.row_metadata[row] = metadata
+                records.append((json.dumps(metadata, ensure_ascii=False), row))
+            self.conn.executemany("UPDATE chunks SET metadata = ? WHERE row = ?", records)
+            self.conn.commit()
+    
+    def delete(self, ids=None, where=None):
+        with self._locked(exclusive=True):
+            if ids is not None:
+                rows = [self.id_to_row[chunk_id] for chunk_id in ids if chunk_id in self.id_to_row]
+            else:
+                rows = list(self.row_metadata)
+            rows = [row for row in rows if matches_where(self.row_metadata[row], where)]
+            if not rows:
+                return
+            # Deleted rows become holes in the matrix and are masked out at query time
+            for row in rows:
+                del self.id_to_row[self.row_to_id.pop(row)]
+                del self.row_metadata[row]
+            self.alive[rows] = False
+            for start in range(0, len(rows), 500):
+                batch = rows[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                self.conn.execute(f"DELETE FROM chunks WHERE row IN ({placeholders})", batch)
+            self.conn.commit()
+            
+            if self.next_row - len(self.row_metadata) > max(self.initial_capacity, len(self.row_metadata)):
+                self.compact()
+    
+    def compact(self):
+        """Close the holes left by deletes by moving live rows to the front"""
+        with self._locked(exclusive=True):
+            live_rows = sorted(self.row_metadata)
+            for new_row, old_row in enumerate(live_rows):
+                if new_row != old_row:
+                    self.matrix[new_row] = self.matrix[old_row]
+            self.matrix.flush()
+            if self.quantized is not None:
+                self.quantized.move_rows(live_rows)
+            # Ascending order never collides with a row that hasn't moved yet
+            self.conn.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new_row, old_row) for new_row, old_row in enumerate(live_rows) if new_row != old_row]
+            )
+            self.conn.commit()
+            
+            self.row_to_id = {new_row: self.row_to_id[old_row] for new_row, old_row in enumerate(live_rows)}
+            self.id_to_row = {chunk_id: row for row, chunk_id in self.row_to_id.items()}
+            self.row_metadata = {new_row: self.row_metadata[old_row] for new_row, old_row in enumerate(live_rows)}
+            self.next_row = len(live_rows)
+            self.alive[:] = False
+            self.alive[:self.next_row] = True
+    
+    def count(self):
+        with self._locked(exclusive=False):
+            return len(self.id_to_row)
+    
+    def reset(self):
+        with self._locked(exclusive=True):
+            # Emptied in place, since other processes may hold the store open
+            self.matrix = None
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.execute("DELETE FROM settings WHERE key != 'dtype'")
+            self.conn.commit()
+            if os.path.exists(self.matrix_path):
+                os.remove(self.matrix_path)
+            self._load()
@@ -0,0 +1,209 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telemetry import stage
+
+class DocumentUpdate:
+    def __init__(self, vector_store, filename: str, store_text: bool = True, text_writer=None):
+        # Chunk-level diff of one document against the chunks already stored for it
+        self.vector_store = vector_store
+        self.filename = filename
+        # Without stored text, chunks keep only offsets into the document's blob in the text store
+        self.store_text = store_text
+        self.text_writer = text_writer
+        self.existing_ids = set(vector_store.get_chunk_ids(filename))
+        # Texts of earlier versions are deleted once the update leaves no chunk pointing at them
+        self.old_file_hashes = vector_store.get_file_hashes(filename) if vector_store.text_store is not None else set()
+        # Duplicates are only linked within the shard this document's chunks are stored in
+        self.shard = vector_store.shard_for({"filename": filename})
+        self.seen_ids = set()
+        self.added_ids: List[str] = []
+        # New chunk_id -> ID of the stored near-duplicate whose embedding it reuses
+        self.linked: Dict[str, str] = {}
+        self.first_batch = None
+        self.added = 0
+        self.linked_count = 0
+        self.unchanged = 0
+    
+    def text_sink(self):
+        """Callback receiving the cleaned document text, or None without a text writer"""
+        return self.text_writer.write if self.text_writer is not None else None
+    
+    def new_positions(self, ids: List[str]) -> List[int]:
+        """Positions of chunks that are not stored yet and need an embedding"""
+        return [i for i, chunk_id in enumerate(ids)
+                if chunk_id not in self.existing_ids and chunk_id not in self.linked]
+    
+    def link_duplicates(self, chunks: List[str], ids: List[str]):
+        """Match new chunks against the near-duplicate index so they skip embedding"""
+        dedup_index = self.vector_store.dedup_index
+        if dedup_index is None:
+            return
+        positions = self.new_positions(ids)
+        # The chunks this update replaces may be deleted at the end, so they are never canonicals
+        canonical_ids = dedup_index.find_duplicates([chunks[i] for i in positions], self.shard, self.existing_ids)
+        for i, canonical_id in zip(positions, canonical_ids):
+            if canonical_id is not None:
+                self.linked[ids[i]] = canonical_id
+    
+    def embed_batch(self, embedding_model, chunks: List[str], ids: List[str],
+                    skip_truncation: bool = False) -> List[Optional[List[float]]]:
+        """Embed only chunks that are not stored yet; unchanged chunks get None"""
+        return embed_batches(embedding_model, [(self, chunks, ids)], skip_truncation)[0]
+    
+    def store_batch(self, chunks: List[str], embeddings: List[Optional[List[float]]],
+                    metadatas: List[Dict[str, Any]], ids: List[str]):
+        """Add new chunks and refresh metadata of unchanged ones"""
+        if not self.store_text:
+            for metadata in metadatas:
+                metadata["text_in_blob"] = True
+        # The batch holding chunk_id 1 is written last, so its presence marks a complete document
+        if self.first_batch is None:
+            self.first_batch = (chunks, embeddings, metadatas, ids)
+            return
+        self._write(chunks, embeddings, metadatas, ids)
+    
+    def _write(self, chunks, embeddings, metadatas, ids):
+        new = self.new_positions(ids)
+        linked = [i for i, chunk_id in enumerate(ids) if chunk_id in self.linked and chunk_id not in self.existing_ids]
+        kept = [i for i, chunk_id in enumerate(ids) if chunk_id in self.existing_ids]
+        if new:
+            new_ids = [ids[i] for i in new]
+            self.vector_store.add_chunks(
+                [chunks[i] if self.store_text else "" for i in new],
+                [embeddings[i] for i in new],
+                [metadatas[i] for i in new],
+                new_ids
+            )
+            self.added_ids.extend(new_ids)
+            self.added += len(new)
+            if self.vector_store.dedup_index is not None:
+                # Signatures come from the chunk text even when only offsets are stored
+                self.vector_store.dedup_index.add(new_ids, [chunks[i] for i in new], self.shard)
+        if linked:
+            linked_ids = [ids[i] for i in linked]
+            self.vector_store.link_duplicates(
+                linked_ids,
+                [self.linked[chunk_id] for chunk_id in linked_ids],
+                [metadatas[i] for i in linked],
+                [chunks[i] if self.store_text else "" for i in linked],
+                [chunks[i] for i in linked]
+            )
+            self.added_ids.extend(linked_ids)
+            self.linked_count += len(linked)
+        if kept:
+            # Positions and page numbers may have moved even though the text did not
+            self.vector_store.update_metadatas(
+                [ids[i] for i in kept],
+                [metadatas[i] for i in kept]
+            )
+            self.unchanged += len(kept)
+        self.seen_ids.update(ids)
+    
+    def finish(self) -> Dict[str, int]:
+        """Write the held-back first batch and delete chunks that no longer exist"""
+        if self.text_writer is not None:
+            # The document text must be readable before the document counts as complete
+            self.text_writer.commit()
+            self.text_writer = None
+        if self.first_batch is not None:
+            self._write(*self.first_batch)
+            self.first_batch = None
+        removed_ids = list(self.existing_ids - self.seen_ids)
+        if removed_ids:
+            self.vector_store.delete_chunks(removed_ids)
+        self.vector_store.release_document_text(self.old_file_hashes)
+        return {
+            "chunks": self.added + self.linked_count + self.unchanged,
+            "added": self.added,
+            "linked": self.linked_count,
+            "unchanged": self.unchanged,
+            "removed": len(removed_ids)
+        }
+    
+    def abort(self):
+        """Remove the chunks this update added"""
+        if self.text_writer is not None:
+            self.text_writer.discard()
+            self.text_writer = None
+        if self.added_ids:
+            self.vector_store.delete_chunks(self.added_ids)
+            self.added_ids = []
+
+def embed_batches(embedding_model, batches: List[Tuple["DocumentUpdate", List[str], List[str]]],
+                  skip_truncation: bool = False) -> List[List[Optional[List[float]]]]:
+    """Embed the new chunks of several (update, chunks, ids) batches with one encode call"""
+    # Bigger encode calls let length bucketing and worker processes do their job
+    texts = []
+    for update, chunks, ids in batches:
+        update.link_duplicates(chunks, ids)
+        texts.extend(chunks[i] for i in update.new_positions(ids))
+    new_embeddings = iter(embedding_model.embed_texts(texts, skip_truncation=skip_truncation) if texts else [])
+    
+    results = []
+    for update, chunks, ids in batches:
+        embeddings: List[Optional[List[float]]] = [None] * len(chunks)
+        for i in update.new_positions(ids):
+            embeddings[i] = next(new_embeddings)
+        results.append(embeddings)
+    return results
+
+def start_document_update(vector_store, filename: str, file_hash: str, text_store=None) -> DocumentUpdate:
+    """Begin a chunk-level update, writing the document text to the text store if one is used"""
+    text_writer = None
+    # Text already stored under this hash is reused as is
+    if text_store is not None and not text_store.has_document(file_hash):
+        text_writer = text_store.open_writer(file_hash)
+    return DocumentUpdate(vector_store, filename, text_store is None, text_writer)
+
+class IngestionPipeline:
+    def __init__(self, document_ingestor, embedding_model, vector_store, batch_size: int = 64,
+                 text_store=None):
+        self.document_ingestor = document_ingestor
+        self.embedding_model = embedding_model
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.text_store = text_store
+    
+    @staticmethod
+    def make_chunk_ids(metadatas: List[Dict[str, Any]]) -> List[str]:
+        """Build content-addressed chunk IDs that survive edits elsewhere in the document"""
+        ids = []
+        for metadata in metadatas:
+            chunk_id = f"{metadata['filename']}_{metadata['chunk_hash']}"
+            if metadata.get("chunk_occurrence"):
+                chunk_id += f"_{metadata['chunk_occurrence']}"
+            ids.append(chunk_id)
+        return ids
+    
+    def ingest_file(self, filepath: str, file_hash: Optional[str] = None,
+                    progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+                    filename: Optional[str] = None) -> Dict[str, int]:
+        """Stream a document through page -> clean -> chunk -> embed batch -> store batch"""
+        filename = filename or os.path.basename(filepath)
+        with stage("ingest_file", document_size=os.path.getsize(filepath),
+                   file_type=os.path.splitext(filepath)[1].lower(), batch_size=self.batch_size) as attributes:
+            if file_hash is None:
+                file_hash = self.document_ingestor.get_file_hash(filepath)
+            skip_truncation = self.document_ingestor.chunking_mode == "tokens"
+            update = start_document_update(self.vector_store, filename, file_hash, self.text_store)
+            total_chunks = 0
+            
+            try:
+                for chunks, metadatas in self.document_ingestor.iter_document_batches(
+                        filepath, self.batch_size, file_hash, filename, update.text_sink()):
+                    ids = self.make_chunk_ids(metadatas)
+                    embeddings = update.embed_batch(self.embedding_model, chunks, ids, skip_truncation)
+                    update.store_batch(chunks, embeddings, metadatas, ids)
+                    
+                    total_chunks += len(chunks)
+                    if progress_callback:
+                        progress_callback(total_chunks, metadatas[-1].get("page_end"))
+                
+                summary = update.finish()
+            except Exception:
+                # Don't leave half-added chunks behind
+                update.abort()
+                raise
+            attributes.update(chunk_count=summary["chunks"], chunks_added=summary["added"])
+            return summary
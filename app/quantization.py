@@ -0,0 +1,84 @@
+from typing import Tuple
+
+import numpy as np
+
+QUANTIZATION_LEVELS = ("int8", "binary")
+
+# Number of set bits for every byte value, for Hamming distances on packed codes
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
+
+class QuantizedIndex:
+    """Compact in-memory copy of the embedding matrix used for the first-pass candidate scan"""
+    
+    def __init__(self, level: str, dim: int, block_rows: int = 16384):
+        if level not in QUANTIZATION_LEVELS:
+            raise ValueError(f"Unknown quantization level: {level}")
+        self.level = level
+        self.dim = dim
+        self.block_rows = block_rows
+        if level == "int8":
+            self.codes = np.zeros((0, dim), dtype=np.int8)
+            # Per-row scale so short vectors don't waste the int8 range
+            self.scales = np.zeros(0, dtype=np.float32)
+        else:
+            self.codes = np.zeros((0, (dim + 7) // 8), dtype=np.uint8)
+            self.scales = None
+    
+    def resize(self, capacity: int):
+        """Grow the code arrays to hold capacity rows"""
+        if capacity <= len(self.codes):
+            return
+        codes = np.zeros((capacity, self.codes.shape[1]), dtype=self.codes.dtype)
+        codes[:len(self.codes)] = self.codes
+        self.codes = codes
+        if self.scales is not None:
+            scales = np.zeros(capacity, dtype=np.float32)
+            scales[:len(self.scales)] = self.scales
+            self.scales = scales
+    
+    def set_rows(self, start: int, vectors: np.ndarray):
+        """Quantize normalized float vectors into rows [start, start + len(vectors))"""
+        self.resize(start + len(vectors))
+        self.codes[start:start + len(vectors)], scales = self.encode(vectors)
+        if self.scales is not None:
+            self.scales[start:start + len(vectors)] = scales
+    
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (codes, scales) for float vectors; scales are None for binary codes"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.level == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return np.packbits(vectors > 0, axis=1), None
+    
+    def move_rows(self, live_rows):
+        """Keep only live_rows, moved to the front in order (after compaction)"""
+        count = len(live_rows)
+        self.codes[:count] = self.codes[live_rows]
+        if self.scales is not None:
+            self.scales[:count] = self.scales[live_rows]
+    
+    def approximate_scores(self, queries: np.ndarray, n_rows: int) -> np.ndarray:
+        """Approximate similarity of each query to rows [0, n_rows); higher is closer"""
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        if self.level == "int8":
+            for start in range(0, n_rows, self.block_rows):
+                end = min(start + self.block_rows, n_rows)
+                block = self.codes[start:end].astype(np.float32)
+                scores[:, start:end] = (queries @ block.T) * self.scales[start:end]
+        else:
+            query_codes, _ = self.encode(queries)
+            for start in range(0, n_rows, self.block_rows):
+                end = min(start + self.block_rows, n_rows)
+                xor = np.bitwise_xor(query_codes[:, None, :], self.codes[None, start:end, :])
+                # Fewer differing sign bits means a smaller angle
+                scores[:, start:end] = -POPCOUNT[xor].sum(axis=2).astype(np.float32)
+        return scores
+    
+    def nbytes(self, n_rows: int) -> int:
+        """Memory used by the first n_rows rows"""
+        size = self.codes[:n_rows].nbytes
+        if self.scales is not None:
+            size += self.scales[:n_rows].nbytes
+        return size
@@ -0,0 +1,101 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from numpy_backend import NumpyBackend
+from quantization import QUANTIZATION_LEVELS
+from vector_store import create_backend
+
+def compare_quantization(backend: NumpyBackend, n_queries: int = 200, k: int = 10,
+                         rerank_factors: List[int] = (1, 2, 4, 8), seed: int = 0) -> List[Dict[str, Any]]:
+    """Measure recall@k and latency of each quantization level against exact search"""
+    live_rows = np.flatnonzero(backend.alive[:backend.next_row])
+    if len(live_rows) <= k:
+        raise ValueError(f"Need more than {k} stored chunks to measure recall@{k}")
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(live_rows, size=min(n_queries, len(live_rows)), replace=False)
+    # Stored chunks serve as queries; each query's own row is excluded from both result lists
+    queries = np.asarray(backend.matrix[np.sort(sample)], dtype=np.float32)
+    query_rows = np.sort(sample)
+    
+    def without_self(rows, query_row):
+        return [row for row in rows if row != query_row][:k]
+    
+    def timed(search):
+        latencies = []
+        found = []
+        for query_row, query in zip(query_rows, queries):
+            start = time.perf_counter()
+            rows, _ = search(query[None, :])
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(without_self(rows[0].tolist(), query_row))
+        return found, latencies
+    
+    exact, exact_latencies = timed(lambda query: backend.exact_top_k(query, k + 1))
+    n_rows = backend.next_row
+    report = [{
+        "level": f"exact ({backend.dtype.name})",
+        "rerank_factor": None,
+        "recall_at_k": 1.0,
+        "p50_ms": float(np.percentile(exact_latencies, 50)),
+        "p99_ms": float(np.percentile(exact_latencies, 99)),
+        "index_mb": backend.matrix[:n_rows].nbytes / 1e6
+    }]
+    
+    for level in QUANTIZATION_LEVELS:
+        quantized = backend.build_quantized_index(level)
+        for rerank_factor in rerank_factors:
+            found, latencies = timed(
+                lambda query: backend.two_stage_top_k(query, k + 1, quantized, rerank_factor)
+            )
+            recall = np.mean([
+                len(set(approximate) & set(reference)) / len(reference)
+                for approximate, reference in zip(found, exact)
+            ])
+            report.append({
+                "level": level,
+                "rerank_factor": rerank_factor,
+                "recall_at_k": float(recall),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "index_mb": quantized.nbytes(n_rows) / 1e6
+            })
+    return report
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Compare recall@k of quantized two-stage retrieval against exact search"
+    )
+    parser.add_argument("--persist-directory", default="data/vectors", help="Vector store directory")
+    parser.add_argument("--shard", default=None, help="Report on one shard of a sharded store")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--queries", type=int, default=200, help="Stored chunks sampled as queries")
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Candidates scanned per result before the exact rerank")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+    
+    backend = create_backend("numpy", args.persist_directory, shard=args.shard)
+    report = compare_quantization(backend, args.queries, args.k, args.rerank_factors)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"recall@{args.k} over {min(args.queries, backend.count())} sampled queries, "
+          f"{backend.count()} chunks")
+    print(f"{'level':<18}{'rerank':>8}{'recall':>9}{'p50 ms':>9}{'p99 ms':>9}{'index MB':>10}")
+    for row in report:
+        rerank = "-" if row["rerank_factor"] is None else f"x{row['rerank_factor']}"
+        print(f"{row['level']:<18}{rerank:>8}{row['recall_at_k']:>9.3f}"
+              f"{row['p50_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['index_mb']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+def normalize_query(query: str) -> str:
+    """Fold case and whitespace so trivially different spellings share a cache entry"""
+    return " ".join(query.casefold().split())
+
+class ResultCache:
+    """In-memory LRU cache of search results with a time-to-live"""
+    
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (collection version, stored at, results)
+        self.entries: "OrderedDict[Hashable, Tuple[int, float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """Return cached results, or None if missing, expired or from an older collection version"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry_version, stored_at, results = entry
+                if entry_version == version and time.monotonic() - stored_at < self.ttl_seconds:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return results
+                # Stale entries are dropped as soon as they are seen
+                del self.entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key: Hashable, version: int, results: Any):
+        """Store results computed against the given collection version"""
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (version, time.monotonic(), results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and current size"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "evictions": self.evictions
+            }
+    
+    def clear(self):
+        """Remove every cached result"""
+        with self.lock:
+            self.entries.clear()
@@ -1,12 +1,17 @@
-from typing import List, Dict, Any, Tuple
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Any, Optional, Tuple
+from result_cache import ResultCache, normalize_query
+from telemetry import stage
+from text_store import fill_chunk_documents
 
 class SearchEngine:
-    def __init__(self, vector_store, embedding_model):
+    def __init__(self, vector_store, embedding_model, result_cache: Optional[ResultCache] = None,
+                 text_store=None):
         self.vector_store = vector_store
         self.embedding_model = embedding_model
         self.similarity_threshold = 0.1
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+        # Chunks stored by offset get their text sliced from here
+        self.text_store = text_store
     
     def validate_query(self, query: str) -> Tuple[bool, str]:
         """Validate query and return (is_valid, message)"""
@@ -22,35 +27,95 @@ class SearchEngine:
         similarity = 1 - cosine_distance
         return max(0, similarity * 100)
     
-    def search_documents(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
-        """Search for relevant document chunks"""
+    def cache_key(self, query: str, top_k: int, shards: Optional[List[str]] = None) -> Tuple:
+        """Key cached results by everything that changes them"""
+        return (normalize_query(query), top_k, self.similarity_threshold,
+                tuple(sorted(shards)) if shards else None)
+    
+    def search_documents(self, query: str, top_k: int = 10,
+                         shards: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Search for relevant document chunks, optionally in a subset of shards"""
         # Validate query
         is_valid, message = self.validate_query(query)
         if not is_valid:
             return [{"error": message}]
         
-        # Generate query embedding
-        query_embedding = self.embedding_model.embed_query(query)
+        with stage("search_documents", top_k=top_k, query_size=len(query)) as attributes:
+            # Read the version first so a concurrent write can only make the entry stale
+            version = self.vector_store.version
+            key = self.cache_key(query, top_k, shards)
+            cached = self.result_cache.get(key, version)
+            attributes["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+            
+            # Generate query embedding
+            query_embedding = self.embedding_model.embed_query(query)
+            
+            # Search vector store
+            results = self.vector_store.search(query_embedding, n_results=top_k, shards=shards)
+            
+            search_results = self.process_results(results, 0)
+            self.result_cache.put(key, version, search_results)
+            return search_results
+    
+    def search_many(self, queries: List[str], top_k: int = 10,
+                    shards: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Search for relevant document chunks for a batch of queries"""
+        # Validate every query before touching the model
+        batch_results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        version = self.vector_store.version
+        valid_indices = []
+        for i, query in enumerate(queries):
+            is_valid, message = self.validate_query(query)
+            if not is_valid:
+                batch_results[i] = [{"error": message}]
+                continue
+            cached = self.result_cache.get(self.cache_key(query, top_k, shards), version)
+            if cached is not None:
+                batch_results[i] = cached
+            else:
+                valid_indices.append(i)
+        
+        if not valid_indices:
+            return batch_results
         
-        # Search vector store
-        results = self.vector_store.search(query_embedding, n_results=top_k)
+        with stage("search_many", batch_size=len(valid_indices), top_k=top_k):
+            # One batched forward pass and one vector store round trip
+            valid_queries = [queries[i] for i in valid_indices]
+            query_embeddings = self.embedding_model.embed_queries(valid_queries)
+            results = self.vector_store.search_many(query_embeddings, n_results=top_k, shards=shards)
+            
+            for position, i in enumerate(valid_indices):
+                batch_results[i] = self.process_results(results, position)
+                self.result_cache.put(self.cache_key(queries[i], top_k, shards), version, batch_results[i])
         
-        if not results['documents'] or not results['documents'][0]:
+        return batch_results
+    
+    def process_results(self, results: Dict[str, Any], index: int) -> List[Dict[str, Any]]:
+        """Convert the raw results of one query into scored search results"""
+        with stage("process_results") as attributes:
+            search_results = self._process_results(results, index)
+            attributes["result_count"] = len(search_results)
+            return search_results
+    
+    def _process_results(self, results: Dict[str, Any], index: int) -> List[Dict[str, Any]]:
+        if not results['documents'] or not results['documents'][index]:
             return [{"error": "No relevant section found."}]
         
         # Process results
         search_results = []
-        for i in range(len(results['documents'][0])):
-            distance = results['distances'][0][i]
+        for i in range(len(results['documents'][index])):
+            distance = results['distances'][index][i]
             similarity_percentage = self.calculate_similarity_percentage(distance)
             
             # Filter by similarity threshold
             if similarity_percentage >= (self.similarity_threshold * 100):
                 result = {
-                    "text": results['documents'][0][i],
+                    "text": results['documents'][index][i],
                     "similarity_percentage": round(similarity_percentage, 2),
-                    "metadata": results['metadatas'][0][i],
-                    "chunk_id": results['ids'][0][i]
+                    "metadata": results['metadatas'][index][i],
+                    "chunk_id": results['ids'][index][i]
                 }
                 search_results.append(result)
         
@@ -60,4 +125,13 @@ class SearchEngine:
         # Sort by similarity percentage (descending)
         search_results.sort(key=lambda x: x['similarity_percentage'], reverse=True)
         
+        # Only the results actually returned pay for decompression
+        texts = fill_chunk_documents(
+            self.text_store,
+            [result["text"] for result in search_results],
+            [result["metadata"] for result in search_results]
+        )
+        for result, text in zip(search_results, texts):
+            result["text"] = text
+        
         return search_results
\ No newline at end of file
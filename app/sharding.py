@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from vector_store import VectorBackend, create_backend
+
+SHARD_STRATEGIES = ("hash", "group")
+DEFAULT_SHARD = "default"
+
+def shard_name_for_group(group: str) -> str:
+    """Turn a tenant or directory name into a valid collection suffix"""
+    name = re.sub(r"[^A-Za-z0-9_-]+", "-", group).strip("-_")[:48]
+    return name or DEFAULT_SHARD
+
+def merge_results(shard_results: List[Dict[str, Any]], n_results: int, n_queries: int) -> Dict[str, Any]:
+    """Merge per-shard query results into one nearest-first top-k per query"""
+    merged: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    for index in range(n_queries):
+        # Each shard's list is already sorted by distance, so a lazy heap merge suffices
+        streams = [
+            zip(result['distances'][index], result['ids'][index],
+                result['documents'][index], result['metadatas'][index])
+            for result in shard_results
+            if result['ids'] and result['ids'][index]
+        ]
+        top = list(itertools.islice(heapq.merge(*streams, key=lambda hit: hit[0]), n_results))
+        merged["distances"].append([hit[0] for hit in top])
+        merged["ids"].append([hit[1] for hit in top])
+        merged["documents"].append([hit[2] for hit in top])
+        merged["metadatas"].append([hit[3] for hit in top])
+    return merged
+
+class ShardedBackend(VectorBackend):
+    """Partitions chunks across independent backends and fans queries out in parallel"""
+    
+    def __init__(self, backend_name: str, persist_directory: str, shard_by: str = "hash",
+                 num_shards: int = 4, max_workers: Optional[int] = None, **backend_options):
+        if shard_by not in SHARD_STRATEGIES:
+            raise ValueError(f"Unknown shard strategy: {shard_by}")
+        self.backend_name = backend_name
+        self.persist_directory = persist_directory
+        self.backend_options = backend_options
+        self.lock = threading.Lock()
+        
+        # The layout is fixed once chunks are stored, otherwise routing would change
+        self.layout_path = os.path.join(persist_directory, "shards.json")
+        layout = {"shard_by": shard_by, "num_shards": num_shards, "shards": []}
+        if os.path.exists(self.layout_path):
+            with open(self.layout_path, encoding="utf-8") as f:
+                stored = json.load(f)
+            if (stored["shard_by"], stored["num_shards"]) != (shard_by, num_shards):
+                raise ValueError(
+                    f"Vector store is sharded by {stored['shard_by']} into {stored['num_shards']} shards, "
+                    f"not by {shard_by} into {num_shards}"
+                )
+            layout = stored
+        self.shard_by = shard_by
+        self.num_shards = num_shards
+        if shard_by == "hash" and not layout["shards"]:
+            layout["shards"] = [f"shard-{i:02d}" for i in range(num_shards)]
+        
+        self.shards: Dict[str, VectorBackend] = {}
+        for name in layout["shards"]:
+            self.shards[name] = create_backend(backend_name, persist_directory, shard=name, **backend_options)
+        self._save_layout()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(32, max(4, len(self.shards))),
+                                           thread_name_prefix="shard-query")
+    
+    def _save_layout(self):
+        with open(self.layout_path, "w", encoding="utf-8") as f:
+            json.dump({"shard_by": self.shard_by, "num_shards": self.num_shards,
+                       "shards": sorted(self.shards)}, f)
+    
+    def shard_for(self, metadata: Dict[str, Any]) -> str:
+        """Pick the shard for a chunk; every chunk of a document lands in the same shard"""
+        filename = metadata.get("filename", "")
+        if self.shard_by == "hash":
+            # Filename rather than content hash, so edited documents stay in place
+            return f"shard-{zlib.crc32(filename.encode('utf-8')) % self.num_shards:02d}"
+        group = metadata.get("tenant")
+        if group is None:
+            # Top-level directory of the (relative) filename, e.g. "<tenant>/report.pdf"
+            group = filename.split("/", 1)[0] if "/" in filename else DEFAULT_SHARD
+        return shard_name_for_group(str(group))
+    
+    def _shard(self, name: str) -> VectorBackend:
+        with self.lock:
+            if name not in self.shards:
+                self.shards[name] = create_backend(self.backend_name, self.persist_directory,
+                                                   shard=name, **self.backend_options)
+                self._save_layout()
+            return self.shards[name]
+    
+    def _route(self, metadatas: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+        positions: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            positions.setdefault(self.shard_for(metadata), []).append(i)
+        return positions
+    
+    def shard_names(self) -> List[str]:
+        """Names of every shard, in a stable order"""
+        with self.lock:
+            return sorted(self.shards)
+    
+    def add(self, ids, documents, embeddings, metadatas):
+        for name, positions in self._route(metadatas).items():
+            self._shard(name).add(
+                [ids[i] for i in positions],
+                [documents[i] for i in positions],
+                [embeddings[i] for i in positions],
+                [metadatas[i] for i in positions]
+            )
+    
+    def query(self, query_embeddings, n_results, shards: Optional[List[str]] = None):
+        names = [name for name in (shards or self.shard_names()) if name in self.shards]
+        backends = [self.shards[name] for name in names]
+        # Each shard searches its own index concurrently; HNSW and NumPy release the GIL while they do
+        shard_results = list(self.executor.map(
+            lambda backend: backend.query(query_embeddings, n_results), backends
+        ))
+        return merge_results(shard_results, n_results, len(query_embeddings))
+    
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        pages = []
+        remaining = limit
+        skip = offset or 0
+        for name in self.shard_names():
+            if remaining is not None and remaining <= 0:
+                break
+            backend = self.shards[name]
+            if skip:
+                # Offsets run across shards in name order; skip whole shards by counting their matches
+                matching = backend.count() if ids is None and where is None else \
+                    len(backend.get(ids=ids, where=where, include=[])['ids'])
+                if skip >= matching:
+                    skip -= matching
+                    continue
+            page = backend.get(ids=ids, where=where, limit=remaining, offset=skip or None, include=include)
+            skip = 0
+            pages.append(page)
+            if remaining is not None:
+                remaining -= len(page['ids'])
+        
+        included = include if include is not None else ["metadatas", "documents"]
+        results: Dict[str, Any] = {"ids": [chunk_id for page in pages for chunk_id in page['ids']]}
+        for key in ("documents", "metadatas", "embeddings"):
+            results[key] = [item for page in pages for item in page[key]] if key in included else None
+        return results
+    
+    def update(self, ids, metadatas):
+        for name, positions in self._route(metadatas).items():
+            if name in self.shards:
+                self.shards[name].update([ids[i] for i in positions], [metadatas[i] for i in positions])
+    
+    def delete(self, ids=None, where=None):
+        for backend in list(self.shards.values()):
+            backend.delete(ids=ids, where=where)
+    
+    def count(self):
+        return sum(backend.count() for backend in list(self.shards.values()))
+    
+    def reset(self):
+        for backend in list(self.shards.values()):
+            backend.reset()
+    
+    def reset_shard(self, name: str):
+        """Remove every chunk of one shard, leaving the others untouched"""
+        if name not in self.shards:
+            raise ValueError(f"Unknown shard: {name}")
+        self.shards[name].reset()
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    from opentelemetry import metrics, trace
+except ImportError:
+    # Per-request breakdowns still work without OpenTelemetry installed
+    metrics = trace = None
+
+if trace is not None:
+    # Proxies until setup_telemetry installs real providers; no-ops if it never does
+    tracer = trace.get_tracer("vectorqa")
+    stage_duration = metrics.get_meter("vectorqa").create_histogram(
+        "vectorqa.stage.duration", unit="ms", description="Time spent in one ingest or search stage"
+    )
+else:
+    tracer = stage_duration = None
+
+_setup_lock = threading.Lock()
+_configured = False
+
+class TimingBreakdown:
+    """Time spent in each stage during one request, in the order stages started"""
+    
+    def __init__(self):
+        # stage -> [calls, total milliseconds]
+        self.stages: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+    
+    def begin(self, name: str):
+        with self.lock:
+            self.stages.setdefault(name, [0, 0.0])
+    
+    def add(self, name: str, elapsed_ms: float):
+        with self.lock:
+            totals = self.stages.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed_ms
+    
+    def rows(self) -> List[Dict[str, Any]]:
+        """One row per stage; enclosing stages include the time of the stages they contain"""
+        with self.lock:
+            return [
+                {"stage": name, "calls": int(calls), "total_ms": round(total_ms, 2)}
+                for name, (calls, total_ms) in self.stages.items()
+            ]
+
+_current_breakdown: ContextVar[Optional[TimingBreakdown]] = ContextVar("timing_breakdown", default=None)
+
+@contextmanager
+def collect_timings(breakdown: Optional[TimingBreakdown] = None) -> Iterator[TimingBreakdown]:
+    """Collect the stages run by the enclosed code (and threads started via asyncio.to_thread)"""
+    if breakdown is None:
+        breakdown = TimingBreakdown()
+    token = _current_breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _current_breakdown.reset(token)
+
+@contextmanager
+def stage(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """Record a stage as a span, a duration histogram sample and a line of the request's breakdown"""
+    # Callers may add attributes known only at the end, e.g. the number of chunks produced
+    breakdown = _current_breakdown.get()
+    if breakdown is not None:
+        breakdown.begin(name)
+    span_context = tracer.start_as_current_span(name) if tracer is not None else nullcontext()
+    started = time.perf_counter()
+    with span_context as span:
+        try:
+            yield attributes
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if span is not None:
+                span.set_attributes({key: value for key, value in attributes.items() if value is not None})
+            if stage_duration is not None:
+                # Only the stage name, so the histogram stays low-cardinality
+                stage_duration.record(elapsed_ms, {"stage": name})
+            if breakdown is not None:
+                breakdown.add(name, elapsed_ms)
+
+def setup_telemetry():
+    """Install OpenTelemetry providers exporting to the console or a local file, per TELEMETRY_EXPORTER"""
+    global _configured
+    exporter_name = os.environ.get("TELEMETRY_EXPORTER", "none")
+    with _setup_lock:
+        if _configured or exporter_name == "none":
+            return
+        _configured = True
+        try:
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        except ImportError as e:
+            print(f"Telemetry disabled, OpenTelemetry SDK not installed: {e}")
+            return
+        
+        if exporter_name == "file":
+            path = os.environ.get("TELEMETRY_FILE", "data/telemetry/telemetry.jsonl")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            out = open(path, "a", encoding="utf-8", buffering=1)
+        elif exporter_name == "console":
+            out = None
+        else:
+            print(f"Unknown TELEMETRY_EXPORTER: {exporter_name}")
+            return
+        
+        # One JSON document per line, so the file can be grepped or loaded line by line
+        span_options = {"out": out, "formatter": lambda span: span.to_json(indent=None) + os.linesep} if out else {}
+        metric_options = {"out": out, "formatter": lambda data: data.to_json(indent=None) + os.linesep} if out else {}
+        resource = Resource.create({"service.name": os.environ.get("OTEL_SERVICE_NAME", "vectorqa")})
+        
+        tracer_provider = TracerProvider(resource=resource)
+        tracer_provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(**span_options)))
+        trace.set_tracer_provider(tracer_provider)
+        reader = PeriodicExportingMetricReader(
+            ConsoleMetricExporter(**metric_options),
+            export_interval_millis=int(os.environ.get("TELEMETRY_METRICS_INTERVAL_MS", 60000))
+        )
+        metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=[reader]))
+
+def instrument_fastapi(app):
+    """Add a server span per HTTP request, parent to the stage spans it triggers"""
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    except ImportError:
+        return
+    FastAPIInstrumentor.instrument_app(app)
@@ -0,0 +1,181 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Footer: magic, block size in characters, block count, total characters, offset of the block index
+FOOTER = struct.Struct("<4sIIQQ")
+MAGIC = b"VQT1"
+
+class DocumentTextWriter:
+    """Streams one cleaned document into a blob of independently compressed blocks"""
+    
+    def __init__(self, path: str, block_chars: int, level: int):
+        self.path = path
+        # Unique per writer, so two files with the same content can be ingested concurrently
+        self.temp_path = f"{path}.{os.getpid()}.{id(self)}.tmp"
+        self.block_chars = block_chars
+        self.level = level
+        self.file = open(self.temp_path, "wb")
+        self.pending = ""
+        self.offsets = [0]
+        self.total_chars = 0
+    
+    def write(self, text: str):
+        """Append text; only complete blocks are compressed and written"""
+        self.total_chars += len(text)
+        if len(self.pending) + len(text) < self.block_chars:
+            self.pending += text
+            return
+        # Top the pending tail up to a block, then cut the rest by index; only the short tail is kept
+        start = self.block_chars - len(self.pending)
+        self._write_block(self.pending + text[:start])
+        end = len(text) - (len(text) - start) % self.block_chars
+        for block_start in range(start, end, self.block_chars):
+            self._write_block(text[block_start:block_start + self.block_chars])
+        self.pending = text[end:]
+    
+    def _write_block(self, text: str):
+        data = zlib.compress(text.encode("utf-8"), self.level)
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+    
+    def commit(self):
+        """Write the index and footer, then publish the blob atomically"""
+        if self.pending:
+            self._write_block(self.pending)
+            self.pending = ""
+        index_offset = self.offsets[-1]
+        self.file.write(np.asarray(self.offsets, dtype="<u8").tobytes())
+        self.file.write(FOOTER.pack(MAGIC, self.block_chars, len(self.offsets) - 1,
+                                    self.total_chars, index_offset))
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+    
+    def discard(self):
+        """Drop a partially written blob"""
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+class DocumentTextStore:
+    """Cleaned document text stored once per file_hash, sliced by character offsets on demand"""
+    
+    def __init__(self, store_dir: str = "data/text_store", block_chars: int = 16384,
+                 compression_level: int = 6, max_open_blobs: int = 64, max_cached_blocks: int = 256):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self.block_chars = block_chars
+        self.compression_level = compression_level
+        self.max_open_blobs = max_open_blobs
+        self.max_cached_blocks = max_cached_blocks
+        # file_hash -> (mmap, block offsets, block size); blobs are immutable once committed
+        self.blobs: "OrderedDict[str, tuple]" = OrderedDict()
+        self.blocks: "OrderedDict[tuple, str]" = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def blob_path(self, file_hash: str) -> str:
+        return os.path.join(self.store_dir, f"{file_hash}.blob")
+    
+    def has_document(self, file_hash: str) -> bool:
+        """Check if the document's text is already stored"""
+        return os.path.exists(self.blob_path(file_hash))
+    
+    def open_writer(self, file_hash: str) -> DocumentTextWriter:
+        """Start writing the cleaned text of a document"""
+        return DocumentTextWriter(self.blob_path(file_hash), self.block_chars, self.compression_level)
+    
+    def _open(self, file_hash: str) -> Optional[tuple]:
+        if file_hash in self.blobs:
+            self.blobs.move_to_end(file_hash)
+            return self.blobs[file_hash]
+        try:
+            with open(self.blob_path(file_hash), "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        _, block_chars, n_blocks, _, index_offset = FOOTER.unpack(data[-FOOTER.size:])
+        # Copied so the mmap holds no exported buffer and can be closed on eviction
+        offsets = np.frombuffer(data, dtype="<u8", count=n_blocks + 1, offset=index_offset).copy()
+        self.blobs[file_hash] = (data, offsets, block_chars)
+        while len(self.blobs) > self.max_open_blobs:
+            _, (old_data, _, _) = self.blobs.popitem(last=False)
+            old_data.close()
+        return self.blobs[file_hash]
+    
+    def _block(self, file_hash: str, blob: tuple, index: int) -> str:
+        key = (file_hash, index)
+        if key in self.blocks:
+            self.blocks.move_to_end(key)
+            return self.blocks[key]
+        data, offsets, _ = blob
+        text = zlib.decompress(data[int(offsets[index]):int(offsets[index + 1])]).decode("utf-8")
+        self.blocks[key] = text
+        while len(self.blocks) > self.max_cached_blocks:
+            self.blocks.popitem(last=False)
+        return text
+    
+    def get_text(self, file_hash: str, start: int, end: int) -> Optional[str]:
+        """Return characters [start, end) of a stored document, decompressing only the blocks covered"""
+        with self.lock:
+            blob = self._open(file_hash)
+            if blob is None:
+                return None
+            block_chars = blob[2]
+            first, last = start // block_chars, max(start, end - 1) // block_chars
+            text = "".join(self._block(file_hash, blob, index) for index in range(first, last + 1))
+            base = first * block_chars
+            return text[start - base:end - base]
+    
+    def fill_documents(self, documents: List[Optional[str]], metadatas: List[Dict[str, Any]]) -> List[str]:
+        """Replace the text of chunks stored by offset with the slice of their document"""
+        filled = []
+        for document, metadata in zip(documents, metadatas):
+            if metadata and metadata.get("text_in_blob"):
+                text = self.get_text(metadata["file_hash"], metadata["char_start"], metadata["char_end"])
+                if text is None:
+                    raise FileNotFoundError(f"Text of {metadata.get('filename')} ({metadata['file_hash']}) is not in "
+                                            f"{self.store_dir}; check TEXT_STORE_DIR")
+                if metadata.get("chunking") == "words":
+                    # Word chunks were joined with single spaces across line breaks
+                    text = " ".join(text.split())
+                document = text
+            filled.append(document)
+        return filled
+    
+    def remove_document(self, file_hash: str):
+        """Delete the stored text of one document"""
+        with self.lock:
+            blob = self.blobs.pop(file_hash, None)
+            if blob is not None:
+                blob[0].close()
+            for key in [key for key in self.blocks if key[0] == file_hash]:
+                del self.blocks[key]
+            if os.path.exists(self.blob_path(file_hash)):
+                os.remove(self.blob_path(file_hash))
+    
+    def clear(self):
+        """Remove every stored document"""
+        with self.lock:
+            for data, _, _ in self.blobs.values():
+                data.close()
+            self.blobs.clear()
+            self.blocks.clear()
+            for name in os.listdir(self.store_dir):
+                if name.endswith(".blob"):
+                    os.remove(os.path.join(self.store_dir, name))
+
+def fill_chunk_documents(text_store: Optional[DocumentTextStore], documents: List[Optional[str]],
+                         metadatas: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Fill in the text of chunks stored by offset; fails if they exist but no text store is configured"""
+    if text_store is not None:
+        return text_store.fill_documents(documents, metadatas)
+    if any(metadata and metadata.get("text_in_blob") for metadata in metadatas):
+        raise RuntimeError("Chunks were ingested with their text in the blob text store; "
+                           "set TEXT_STORAGE=blob (and TEXT_STORE_DIR) to read them")
+    return documents
@@ -1,56 +1,488 @@
-import chromadb
 import os
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional, Iterator, Set
 
-class VectorStore:
-    def __init__(self, persist_directory: str = "data/vectors"):
-        self.persist_directory = persist_directory
-        os.makedirs(persist_directory, exist_ok=True)
+from telemetry import stage
+
+class VectorBackend:
+    """Storage interface behind VectorStore; results use ChromaDB's dict-of-lists shape"""
+    
+    def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]],
+            metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+    
+    def query(self, query_embeddings: List[List[float]], n_results: int) -> Dict[str, Any]:
+        """Return ids/documents/metadatas/distances per query, nearest first (cosine distance)"""
+        raise NotImplementedError
+    
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+    
+    def update(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+    
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        raise NotImplementedError
+    
+    def count(self) -> int:
+        raise NotImplementedError
+    
+    def reset(self):
+        """Remove every chunk"""
+        raise NotImplementedError
+
+# Index parameters Chroma accepts per collection, with its defaults
+HNSW_DEFAULTS = {"construction_ef": 100, "search_ef": 10, "M": 16}
+
+class ChromaBackend(VectorBackend):
+    """Persistent ChromaDB collection with an HNSW index"""
+    
+    def __init__(self, persist_directory: str, collection_name: str = "documents",
+                 hnsw: Optional[Dict[str, int]] = None):
+        import chromadb
+        self.collection_name = collection_name
         self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.client.get_or_create_collection(
-            name="documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+        self._recover_rebuild()
+        requested = {**HNSW_DEFAULTS, **(hnsw or {})}
+        self.collection = self._create_collection(requested)
+        # An existing collection keeps the parameters it was built with until it is rebuilt
+        self.hnsw = self.get_hnsw_params()
+        if hnsw and self.hnsw != requested:
+            print(f"Collection {collection_name} uses HNSW parameters {self.hnsw}, not {requested}; "
+                  f"rebuild it with python -m app.hnsw_tuning --apply to change them")
     
-    def add_chunks(self, chunks: List[str], embeddings: List[List[float]], 
-                   metadatas: List[Dict[str, Any]], ids: List[str]):
-        """Add document chunks with embeddings to the vector store"""
+    def _create_collection(self, hnsw: Optional[Dict[str, int]] = None, name: Optional[str] = None):
+        """Open the collection, creating it with the given HNSW parameters only when it does not exist"""
+        name = name or self.collection_name
+        # get_or_create_collection would overwrite an existing collection's metadata with ours
+        if name in {collection.name for collection in self.client.list_collections()}:
+            return self.client.get_collection(name=name)
+        metadata = {"hnsw:space": "cosine"}
+        for key, value in (hnsw or self.hnsw).items():
+            metadata[f"hnsw:{key}"] = int(value)
+        return self.client.create_collection(name=name, metadata=metadata)
+    
+    def _rebuild_name(self) -> str:
+        return f"{self.collection_name}_rebuild"
+    
+    def _recover_rebuild(self):
+        """Finish or discard a rebuild that was interrupted"""
+        names = {collection.name for collection in self.client.list_collections()}
+        if self._rebuild_name() not in names:
+            return
+        if self.collection_name in names:
+            # The copy never completed; the original is intact
+            self.client.delete_collection(name=self._rebuild_name())
+        else:
+            # Interrupted between dropping the original and renaming the copy
+            self.client.get_collection(name=self._rebuild_name()).modify(name=self.collection_name)
+    
+    def get_hnsw_params(self) -> Dict[str, int]:
+        """HNSW parameters the collection was created with"""
+        metadata = self.collection.metadata or {}
+        return {key: int(metadata.get(f"hnsw:{key}", default)) for key, default in HNSW_DEFAULTS.items()}
+    
+    def rebuild(self, hnsw: Dict[str, int], page_size: int = 1000):
+        """Copy every chunk into a new index built with different HNSW parameters"""
+        hnsw = {**self.hnsw, **hnsw}
+        target = self._create_collection(hnsw, name=self._rebuild_name())
+        offset = 0
+        while True:
+            page = self.collection.get(
+                limit=page_size,
+                offset=offset,
+                include=["documents", "embeddings", "metadatas"]
+            )
+            if not page['ids']:
+                break
+            target.add(
+                ids=page['ids'],
+                documents=page['documents'],
+                embeddings=page['embeddings'],
+                metadatas=page['metadatas']
+            )
+            offset += len(page['ids'])
+        # Chroma can't change index parameters in place, so swap the copy in
+        self.client.delete_collection(name=self.collection_name)
+        target.modify(name=self.collection_name)
+        self.collection = target
+        self.hnsw = hnsw
+    
+    def add(self, ids, documents, embeddings, metadatas):
         self.collection.add(
-            documents=chunks,
+            documents=documents,
             embeddings=embeddings,
             metadatas=metadatas,
             ids=ids
         )
     
-    def search(self, query_embedding: List[float], n_results: int = 10) -> Dict[str, Any]:
-        """Search for similar chunks"""
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
+    def query(self, query_embeddings, n_results):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
             n_results=n_results
         )
-        return results
+    
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        # Only pass what was given so Chroma's own defaults apply
+        kwargs: Dict[str, Any] = {"ids": ids, "where": where, "limit": limit, "offset": offset, "include": include}
+        return self.collection.get(**{key: value for key, value in kwargs.items() if value is not None})
+    
+    def update(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+    
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where)
+    
+    def count(self):
+        return self.collection.count()
+    
+    def reset(self):
+        # Delete the collection and recreate it
+        self.client.delete_collection(name=self.collection_name)
+        self.collection = self._create_collection()
+
+def create_backend(name: str, persist_directory: str, shard: Optional[str] = None, **options) -> VectorBackend:
+    """Create a storage backend by name ("chroma" or "numpy"), optionally for one shard"""
+    if name == "chroma":
+        if shard is not None:
+            options["collection_name"] = f"documents_{shard}"
+        return ChromaBackend(persist_directory, **options)
+    if name == "numpy":
+        from numpy_backend import NumpyBackend
+        directory = os.path.join(persist_directory, "numpy")
+        if shard is not None:
+            directory = os.path.join(directory, "shards", shard)
+        return NumpyBackend(directory, **options)
+    raise ValueError(f"Unknown vector store backend: {name}")
+
+class VectorStore:
+    def __init__(self, persist_directory: str = "data/vectors", backend: str = "chroma",
+                 shard_by: Optional[str] = None, num_shards: int = 4, dedup_index=None,
+                 counts_ttl_seconds: float = 300.0, text_store=None, **backend_options):
+        self.persist_directory = persist_directory
+        # Near-duplicate chunks are linked to a stored chunk here instead of being stored again
+        self.dedup_index = dedup_index
+        # Blob text store of chunks stored by offset; a document's text is deleted with its last chunk
+        self.text_store = text_store
+        os.makedirs(persist_directory, exist_ok=True)
+        self.backend_name = backend
+        if shard_by:
+            from sharding import ShardedBackend
+            self.backend = ShardedBackend(backend, persist_directory, shard_by, num_shards, **backend_options)
+        else:
+            self.backend = create_backend(backend, persist_directory, **backend_options)
+        self.sharded = bool(shard_by)
+        # Per-document counts of stored chunks, scanned on first use and kept up to date by writes.
+        # Writes from another process (e.g. the bulk CLI) force a rescan: detected when the total
+        # disagrees with the backend's count, and at the latest after counts_ttl_seconds
+        self._file_chunk_counts: Optional[Dict[str, int]] = None
+        self._file_chunk_counts_at = 0.0
+        self.counts_ttl_seconds = counts_ttl_seconds
+        # Bumped on every write so cached search results can be invalidated
+        self.version = 0
+    
+    def _mark_changed(self):
+        """Invalidate derived state after the collection changed"""
+        self.version += 1
+    
+    def _count_chunks(self, metadatas: List[Dict[str, Any]], delta: int):
+        """Apply added (delta 1) or deleted (delta -1) stored chunks to the per-document counts"""
+        if self._file_chunk_counts is None:
+            return
+        for metadata in metadatas:
+            filename = metadata.get("filename", "Unknown")
+            count = self._file_chunk_counts.get(filename, 0) + delta
+            if count > 0:
+                self._file_chunk_counts[filename] = count
+            else:
+                self._file_chunk_counts.pop(filename, None)
+    
+    def add_chunks(self, chunks: List[str], embeddings: List[List[float]], 
+                   metadatas: List[Dict[str, Any]], ids: List[str]):
+        """Add document chunks with embeddings to the vector store"""
+        with stage("add_chunks", chunk_count=len(ids), backend=self.backend_name):
+            self.backend.add(ids, chunks, embeddings, metadatas)
+        self._count_chunks(metadatas, 1)
+        self._mark_changed()
+    
+    def search(self, query_embedding: List[float], n_results: int = 10,
+               shards: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Search for similar chunks"""
+        return self.search_many([query_embedding], n_results, shards)
+    
+    def search_many(self, query_embeddings: List[List[float]], n_results: int = 10,
+                    shards: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Search for similar chunks for several query embeddings in one round trip"""
+        with stage("collection.query", batch_size=len(query_embeddings), n_results=n_results,
+                   backend=self.backend_name, shards=",".join(shards) if shards else None):
+            if self.sharded:
+                # Only the given shards are queried (all when None), concurrently
+                return self.backend.query(query_embeddings, n_results, shards)
+            return self.backend.query(query_embeddings, n_results)
+    
+    def shard_names(self) -> List[str]:
+        """Names of the shards chunks are partitioned into (empty when unsharded)"""
+        return self.backend.shard_names() if self.sharded else []
+    
+    def shard_for(self, metadata: Dict[str, Any]) -> str:
+        """Name of the shard a chunk with this metadata is stored in ("" when unsharded)"""
+        return self.backend.shard_for(metadata) if self.sharded else ""
+    
+    def clear_shard(self, name: str):
+        """Clear the chunks of one shard without touching the others"""
+        if not self.sharded:
+            raise ValueError("Vector store is not sharded")
+        file_hashes: Set[str] = set()
+        if self.text_store is not None:
+            file_hashes = {metadata.get("file_hash")
+                           for metadata in self.backend.shards[name].get(include=["metadatas"])['metadatas']}
+            if self.dedup_index is not None:
+                file_hashes.update(metadata.get("file_hash") for _, _, metadata in self.dedup_index.get_links_for()
+                                   if self.shard_for(metadata) == name)
+        if self.dedup_index is not None:
+            # Links never cross shards, so nothing elsewhere depends on the cleared chunks
+            self.dedup_index.clear_shard(name)
+        self.backend.reset_shard(name)
+        # Rescanned on next use; clearing a shard is rare
+        self._file_chunk_counts = None
+        self.release_document_text(file_hashes)
+        self._mark_changed()
     
     def document_exists(self, filename: str) -> bool:
         """Check if document already exists in the collection"""
-        results = self.collection.get(
-            where={"filename": filename}
+        results = self.backend.get(
+            where={"filename": filename},
+            limit=1,
+            include=[]
         )
         return len(results['ids']) > 0
     
+    def delete_document(self, filename: str):
+        """Delete every chunk belonging to a document"""
+        if self.dedup_index is not None or self.text_store is not None:
+            self.delete_chunks(self.get_chunk_ids(filename))
+            return
+        self.backend.delete(where={"filename": filename})
+        if self._file_chunk_counts is not None:
+            self._file_chunk_counts.pop(filename, None)
+        self._mark_changed()
+    
+    def is_file_ingested(self, file_hash: str) -> bool:
+        """Check if a file was fully ingested (chunk_id 1 is always stored last)"""
+        results = self.backend.get(
+            where={"$and": [{"file_hash": file_hash}, {"chunk_id": 1}]},
+            limit=1,
+            include=[]
+        )
+        if len(results['ids']) > 0:
+            return True
+        # The first chunk may itself be a linked duplicate
+        return self.dedup_index is not None and \
+            len(self.dedup_index.get_links_for(file_hash=file_hash, chunk_number=1)) > 0
+    
+    def get_chunk_ids(self, filename: str) -> List[str]:
+        """Get the IDs of every chunk stored for a document, including linked duplicates"""
+        results = self.backend.get(
+            where={"filename": filename},
+            include=[]
+        )
+        if self.dedup_index is not None:
+            return results['ids'] + [chunk_id for chunk_id, _, _ in self.dedup_index.get_links_for(filename)]
+        return results['ids']
+    
+    def get_file_hashes(self, filename: str) -> Set[str]:
+        """Content hashes the chunks of a document were produced from"""
+        results = self.backend.get(
+            where={"filename": filename},
+            include=["metadatas"]
+        )
+        file_hashes = {metadata.get("file_hash") for metadata in results['metadatas']}
+        if self.dedup_index is not None:
+            file_hashes.update(metadata.get("file_hash") for _, _, metadata in self.dedup_index.get_links_for(filename))
+        file_hashes.discard(None)
+        return file_hashes
+    
+    def get_filenames_for_hash(self, file_hash: str) -> List[str]:
+        """Get the filenames whose content has the given hash"""
+        results = self.backend.get(
+            where={"file_hash": file_hash},
+            include=["metadatas"]
+        )
+        filenames = {metadata["filename"] for metadata in results['metadatas']}
+        if self.dedup_index is not None:
+            filenames.update(metadata["filename"] for _, _, metadata in self.dedup_index.get_links_for(file_hash=file_hash))
+        return sorted(filenames)
+    
+    def link_duplicates(self, ids: List[str], canonical_ids: List[str], metadatas: List[Dict[str, Any]],
+                        documents: List[str], texts: List[str]):
+        """Record chunks that reuse the embedding of an already stored near-duplicate in their shard"""
+        # All chunks of one document share a shard
+        shard = self.shard_for(metadatas[0]) if metadatas else ""
+        self.dedup_index.link(ids, canonical_ids, metadatas, documents, texts, shard)
+        self._mark_changed()
+    
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Update chunk metadata without touching documents or embeddings"""
+        if self.dedup_index is not None:
+            linked = {chunk_id for chunk_id, _, _ in self.dedup_index.get_links(ids)}
+            if linked:
+                self.dedup_index.update_links(
+                    [chunk_id for chunk_id in ids if chunk_id in linked],
+                    [metadata for chunk_id, metadata in zip(ids, metadatas) if chunk_id in linked]
+                )
+                metadatas = [metadata for chunk_id, metadata in zip(ids, metadatas) if chunk_id not in linked]
+                ids = [chunk_id for chunk_id in ids if chunk_id not in linked]
+        if ids:
+            self.backend.update(ids, metadatas)
+        self._mark_changed()
+    
+    def delete_chunks(self, ids: List[str]):
+        """Delete chunks by ID"""
+        file_hashes: Set[str] = set()
+        if self.text_store is not None and self.dedup_index is not None:
+            file_hashes.update(metadata.get("file_hash") for _, _, metadata in self.dedup_index.get_links(ids))
+        if self.dedup_index is not None:
+            ids = self._release_chunks(ids)
+        if ids:
+            if self._file_chunk_counts is not None or self.text_store is not None:
+                metadatas = self.backend.get(ids=ids, include=["metadatas"])['metadatas']
+                self._count_chunks(metadatas, -1)
+                file_hashes.update(metadata.get("file_hash") for metadata in metadatas)
+            self.backend.delete(ids=ids)
+        self.release_document_text(file_hashes)
+        self._mark_changed()
+    
+    def release_document_text(self, file_hashes: Set[str]):
+        """Delete the stored text of documents that no chunk refers to any more"""
+        if self.text_store is None:
+            return
+        for file_hash in file_hashes - {None}:
+            if self.backend.get(where={"file_hash": file_hash}, limit=1, include=[])['ids']:
+                continue
+            if self.dedup_index is not None and self.dedup_index.get_links_for(file_hash=file_hash):
+                continue
+            self.text_store.remove_document(file_hash)
+    
+    def _release_chunks(self, ids: List[str]) -> List[str]:
+        """Detach chunks from the duplicate index before they are deleted; return the stored ones"""
+        linked = {chunk_id for chunk_id, _, _ in self.dedup_index.get_links(ids)}
+        self.dedup_index.unlink(list(linked))
+        stored = [chunk_id for chunk_id in ids if chunk_id not in linked]
+        
+        # Duplicates that relied on a deleted chunk inherit its embedding: one of them is stored in its place
+        dependents: Dict[str, List[tuple]] = {}
+        for chunk_id, canonical_id, metadata in self.dedup_index.get_links_to(stored):
+            dependents.setdefault(canonical_id, []).append((chunk_id, metadata))
+        if dependents:
+            records = self.backend.get(ids=list(dependents), include=["embeddings"])
+            documents = self.dedup_index.get_documents([chunks[0][0] for chunks in dependents.values()])
+            for canonical_id, embedding in zip(records['ids'], records['embeddings']):
+                chunk_id, metadata = dependents[canonical_id][0]
+                # The duplicate is stored with its own text; only the embedding is inherited
+                self.backend.add([chunk_id], [documents.get(chunk_id, "")], [embedding], [metadata])
+                self._count_chunks([metadata], 1)
+                self.dedup_index.promote(canonical_id, chunk_id)
+        self.dedup_index.remove(stored)
+        return stored
+    
     def get_collection_count(self) -> int:
         """Get total number of chunks in collection"""
-        return self.collection.count()
+        return self.backend.count()
     
     def clear_all_documents(self):
         """Clear all documents from the collection"""
-        # Delete the collection and recreate it
-        self.client.delete_collection(name="documents")
-        self.collection = self.client.get_or_create_collection(
-            name="documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.backend.reset()
+        if self.dedup_index is not None:
+            self.dedup_index.clear()
+        if self.text_store is not None:
+            self.text_store.clear()
+        self._file_chunk_counts = {}
+        self._mark_changed()
     
     def get_all_chunks(self):
         """Get all chunks from the collection"""
-        results = self.collection.get()
-        return results
\ No newline at end of file
+        return self.backend.get()
+    
+    def get_chunks_page(self, limit: int = 20, offset: int = 0, filename: Optional[str] = None,
+                        include_documents: bool = True, include_embeddings: bool = False) -> Dict[str, Any]:
+        """Get one page of chunks, optionally for a single document; linked duplicates follow the stored chunks"""
+        include = ["metadatas"]
+        if include_documents:
+            include.append("documents")
+        if include_embeddings:
+            include.append("embeddings")
+        page = self.backend.get(
+            where={"filename": filename} if filename is not None else None,
+            limit=limit,
+            offset=offset,
+            include=include
+        )
+        if self.dedup_index is None or len(page['ids']) >= limit:
+            return page
+        
+        counts = self._stored_chunk_counts()
+        stored = sum(counts.values()) if filename is None else counts.get(filename, 0)
+        links = self.dedup_index.get_links_page(limit - len(page['ids']), max(0, offset - stored), filename)
+        if not links:
+            return page
+        page = {key: list(value) if value is not None else None for key, value in page.items()}
+        page['ids'].extend(chunk_id for chunk_id, _, _, _ in links)
+        page['metadatas'].extend(metadata for _, _, metadata, _ in links)
+        if include_documents:
+            page['documents'].extend(document for _, _, _, document in links)
+        if include_embeddings:
+            # Linked duplicates share the embedding of their stored chunk
+            canonicals = self.backend.get(ids=list({canonical_id for _, canonical_id, _, _ in links}),
+                                          include=["embeddings"])
+            embeddings = dict(zip(canonicals['ids'], canonicals['embeddings']))
+            page['embeddings'].extend(embeddings.get(canonical_id) for _, canonical_id, _, _ in links)
+        return page
+    
+    def iter_chunks(self, page_size: int = 500, filename: Optional[str] = None,
+                    include_documents: bool = True, include_embeddings: bool = False) -> Iterator[Dict[str, Any]]:
+        """Lazily yield one page of chunks at a time"""
+        offset = 0
+        while True:
+            page = self.get_chunks_page(page_size, offset, filename, include_documents, include_embeddings)
+            if not page['ids']:
+                break
+            yield page
+            if len(page['ids']) < page_size:
+                break
+            offset += page_size
+    
+    def count_chunks(self, filename: Optional[str] = None) -> int:
+        """Count chunks, optionally for a single document, including linked duplicates"""
+        counts = self.get_file_chunk_counts()
+        return sum(counts.values()) if filename is None else counts.get(filename, 0)
+    
+    def _stored_chunk_counts(self, page_size: int = 1000) -> Dict[str, int]:
+        """Per-document counts of stored chunks, paging through metadata only when they may be stale"""
+        if self._file_chunk_counts is not None and (
+                time.monotonic() - self._file_chunk_counts_at >= self.counts_ttl_seconds
+                or sum(self._file_chunk_counts.values()) != self.backend.count()):
+            self._file_chunk_counts = None
+        if self._file_chunk_counts is None:
+            counts: Dict[str, int] = {}
+            offset = 0
+            while True:
+                page = self.backend.get(limit=page_size, offset=offset, include=["metadatas"])
+                for metadata in page['metadatas']:
+                    filename = metadata.get("filename", "Unknown")
+                    counts[filename] = counts.get(filename, 0) + 1
+                if len(page['ids']) < page_size:
+                    break
+                offset += page_size
+            self._file_chunk_counts = counts
+            self._file_chunk_counts_at = time.monotonic()
+        return self._file_chunk_counts
+    
+    def get_file_chunk_counts(self, page_size: int = 1000) -> Dict[str, int]:
+        """Count chunks per document, including linked duplicates"""
+        counts = dict(self._stored_chunk_counts(page_size))
+        if self.dedup_index is not None:
+            for filename, count in self.dedup_index.count_links().items():
+                counts[filename] = counts.get(filename, 0) + count
+        return counts
\ No newline at end of file